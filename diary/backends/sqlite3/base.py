@@ -0,0 +1,32 @@
+from re import fullmatch
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite для нескольких одновременных запросов (ENGINE = "diary.backends.sqlite3").
+
+    Дополнительный ключ OPTIONS (остальные, как и у стандартного бэкенда, уходят в sqlite3.connect):
+    pragmas (dict): PRAGMA, выполняемые при открытии каждого соединения,
+        например {"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 5000}.
+
+    Режим BEGIN транзакций atomic задаёт стандартный OPTIONS["transaction_mode"] (Django 5.1+).
+    IMMEDIATE берёт блокировку записи в начале транзакции: ожидание идёт через busy_timeout,
+    а не заканчивается «database is locked» при попытке читающей транзакции начать запись.
+    """
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop("pragmas", {})
+        for name, value in self.pragmas.items():
+            if not fullmatch(r"\w+", name) or not fullmatch(r"-?\w+", str(value)):
+                raise ImproperlyConfigured(f"Invalid SQLite pragma {name}={value!r}")
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
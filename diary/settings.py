@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 import os.path
 from _socket import gethostbyname_ex, gethostname
+from datetime import timedelta
 from os import getenv
 from pathlib import Path
 
@@ -106,13 +107,88 @@ WSGI_APPLICATION = "diary.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE selects the database:
+# - diary.backends.sqlite3 (default) applies the pragmas below on every new connection and
+#   starts atomic blocks with BEGIN <SQLITE_TRANSACTION_MODE>;
+# - django.db.backends.sqlite3 is the stock backend (rollback journal, deferred transactions);
+# - django.db.backends.postgresql needs psycopg 3 with the pool extra (poetry install -E postgres)
+#   and takes connections from a psycopg_pool pool instead of keeping persistent ones.
+DB_ENGINE = getenv("DB_ENGINE") or "diary.backends.sqlite3"
+
+if DB_ENGINE == "django.db.backends.postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": DB_ENGINE,
+            "NAME": getenv("DB_NAME") or "diary",
+            "USER": getenv("DB_USER") or "",
+            "PASSWORD": getenv("DB_PASSWORD") or "",
+            "HOST": getenv("DB_HOST") or "",
+            "PORT": getenv("DB_PORT") or "",
+            "OPTIONS": {
+                "pool": {
+                    "min_size": int(getenv("DB_POOL_MIN_SIZE") or 2),
+                    "max_size": int(getenv("DB_POOL_MAX_SIZE") or 10),
+                    # seconds to wait for a free connection
+                    "timeout": float(getenv("DB_POOL_TIMEOUT") or 10),
+                },
+            },
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": DB_ENGINE,
+            "NAME": getenv("DB_NAME") or BASE_DIR / "db.sqlite3",
+            "CONN_MAX_AGE": int(getenv("DB_CONN_MAX_AGE") or 600),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "transaction_mode": getenv("SQLITE_TRANSACTION_MODE") or "IMMEDIATE",
+                "pragmas": {
+                    "journal_mode": getenv("SQLITE_JOURNAL_MODE") or "WAL",
+                    "synchronous": getenv("SQLITE_SYNCHRONOUS") or "NORMAL",
+                    # bytes
+                    "mmap_size": int(getenv("SQLITE_MMAP_SIZE") or 256 * 1024 * 1024),
+                    # negative: KiB, positive: pages
+                    "cache_size": int(getenv("SQLITE_CACHE_SIZE") or -64 * 1024),
+                    # milliseconds
+                    "busy_timeout": int(getenv("SQLITE_BUSY_TIMEOUT") or 5000),
+                },
+            },
+        }
+    }
+    if DB_ENGINE == "django.db.backends.sqlite3":
+        DATABASES["default"]["OPTIONS"] = {}
+
+# Write transactions that fail on a locked database are retried with exponential backoff and
+# full jitter (diaryapp.retry): up to WRITE_RETRY_ATTEMPTS attempts, delays in seconds
+WRITE_RETRY_ATTEMPTS = int(getenv("WRITE_RETRY_ATTEMPTS") or 5)
+WRITE_RETRY_BASE_DELAY = float(getenv("WRITE_RETRY_BASE_DELAY") or 0.05)
+WRITE_RETRY_MAX_DELAY = float(getenv("WRITE_RETRY_MAX_DELAY") or 1)
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Locmem by default; for a single-box deploy with several workers use
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache and CACHE_LOCATION=<dir>
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": getenv("CACHE_BACKEND")
+        or "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": getenv("CACHE_LOCATION") or "diary",
+        "TIMEOUT": int(getenv("CACHE_TIMEOUT") or 60 * 60 * 24),
     }
 }
 
+# Quest item types (labels and allowed keys), reloaded on change
+TYPES_PATH = BASE_DIR / "types.json"
+TYPES_CHECK_INTERVAL = float(getenv("TYPES_CHECK_INTERVAL") or 1)
+
+# Origin rotation for new quests: "priority" (least recently extracted) or "weighted"
+ORIGIN_ROTATION = getenv("ORIGIN_ROTATION") or "priority"
+ORIGIN_ROTATION_PERIOD = timedelta(
+    hours=float(getenv("ORIGIN_ROTATION_PERIOD_HOURS") or 24)
+)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
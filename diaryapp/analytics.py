@@ -0,0 +1,417 @@
+from csv import writer
+from datetime import date as Date
+from itertools import chain
+from random import getrandbits
+from typing import Iterator
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
+from django.db.transaction import on_commit
+from django.utils.timezone import localtime
+
+from .item_types import item_types
+from .models import Origin, Quest, QuestItem, Task
+
+PERCENTILES = 50, 90, 99
+DATA_VERSION_KEY = "analytics:data-version"
+CSV_HEADER = (
+    "kind",
+    "date",
+    "origin",
+    "theme",
+    "type",
+    "status",
+    "time_to_complete_s",
+)
+# общие для задач и ошибок колонки: дата, источник и тема квеста, тип, время до завершения квеста
+QUEST_COLUMNS = (
+    "quest__created_date",
+    "quest__origin__name",
+    "quest__theme",
+    "type",
+    "quest__created_at",
+    "quest__completed_at",
+)
+
+
+class _Echo:
+    """
+    Файлоподобный объект для csv.writer: writerow возвращает строку, а не пишет её.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def _rows(model, date_from: Date, date_to: Date, origin: int | None, extra=()):
+    queryset = model.objects.filter(quest_filter(date_from, date_to, origin, "quest__"))
+    if model is QuestItem:
+        queryset = queryset.filter(kind=QuestItem.KINDS["errors"])
+    return queryset.order_by("quest__created_date", "pk").values_list(
+        *QUEST_COLUMNS, *extra
+    )
+
+
+def csv_lines(
+    date_from: Date,
+    date_to: Date,
+    origin: int | None = None,
+    chunk_size: int = 2000,
+) -> Iterator[str]:
+    """
+    Плоская выгрузка для анализа: строка на задачу и строка на ошибку квестов периода.
+
+    Строки читаются values_list(...).iterator(chunk_size) — кортежами, без создания моделей,
+    поэтому память не зависит от числа строк. Для ошибок status пустой.
+
+    param:
+    date_from, date_to (date): период по дате создания квеста, включительно.
+    origin (int): id источника; None — все.
+
+    return:
+    Iterator[str]: строки CSV с заголовком.
+    """
+    csv = writer(_Echo())
+    yield csv.writerow(CSV_HEADER)
+    for kind, model, extra in (("task", Task, ("status",)), ("error", QuestItem, ())):
+        rows = _rows(model, date_from, date_to, origin, extra)
+        for row in rows.iterator(chunk_size=chunk_size):
+            date, origin_name, theme, type_id, created_at, completed_at = row[:6]
+            yield csv.writerow(
+                (
+                    kind,
+                    date,
+                    origin_name,
+                    theme,
+                    item_types.name(type_id),
+                    row[6] if extra else "",
+                    (
+                        round((completed_at - created_at).total_seconds())
+                        if completed_at
+                        else ""
+                    ),
+                )
+            )
+
+
+def quest_filter(
+    date_from: Date, date_to: Date, origin: int | None = None, prefix: str = ""
+) -> Q:
+    """
+    Условие на квесты периода (и источника); prefix — путь к квесту, например "quest__".
+    """
+    condition = Q(**{f"{prefix}created_date__range": (date_from, date_to)})
+    if origin is not None:
+        condition &= Q(**{f"{prefix}origin": origin})
+    return condition
+
+
+def data_version() -> str:
+    """
+    Версия данных для кэша отчётов: счётчик в кэше (без запросов к базе), который сдвигает
+    bump_data_version(). Пропавший из кэша счётчик начинается со случайного значения,
+    чтобы не совпасть с версией ещё не истёкших отчётов.
+    """
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        cache.add(DATA_VERSION_KEY, getrandbits(48), timeout=None)
+        version = cache.get(DATA_VERSION_KEY)
+    return str(version)
+
+
+def bump_data_version():
+    """
+    Делает закэшированные отчёты устаревшими после фиксации текущей транзакции (или сразу).
+    Вызывается при записи квестов, их задач и элементов и при изменении или удалении источников.
+    """
+
+    def bump():
+        try:
+            cache.incr(DATA_VERSION_KEY)
+        except ValueError:
+            cache.set(DATA_VERSION_KEY, getrandbits(48), timeout=None)
+
+    on_commit(bump)
+
+
+def int_columns(queryset, *columns, chunk_size: int = 10000) -> np.ndarray:
+    """
+    Целочисленные колонки values_list (имена полей или выражения) в массив формы (n, колонки)
+    без списка кортежей в памяти.
+    """
+    rows = queryset.values_list(*columns).iterator(chunk_size=chunk_size)
+    return np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(
+        -1, len(columns)
+    )
+
+
+def week_start(ordinals: np.ndarray) -> np.ndarray:
+    """
+    Порядковые номера дат (date.toordinal()) -> номера понедельников их недель.
+    """
+    # toordinal() == 1 — понедельник, поэтому (ordinal - 1) % 7 — день недели
+    return ordinals - (ordinals - 1) % 7
+
+
+def _incidence(rows, columns, shape) -> np.ndarray:
+    matrix = np.zeros(shape, dtype=np.int32)
+    matrix[rows, columns] = 1
+    return matrix
+
+
+def _type_names(codes) -> list:
+    return [item_types.name(int(code)) if code else None for code in codes]
+
+
+def error_report(date_from: Date, date_to: Date, origin: int | None = None) -> dict:
+    """
+    Отчёт по типам ошибок квестов периода. Считается на массивах NumPy, собранных из values_list:
+    квесты индексируются по возрастанию id, ошибки и задачи привязываются к ним searchsorted.
+
+    return:
+    dict:
+        error_types — типы ошибок по убыванию частоты (None — без типа), frequency — число ошибок;
+        cooccurrence — матрица error_types x error_types: в скольких квестах встретились оба типа
+            (на диагонали — квесты с этим типом);
+        task_types — по типам задач: задачи, квесты с такими задачами, из них квесты с ошибками,
+            доля таких квестов (error_rate) и ошибок на квест;
+        weeks — понедельники недель периода, trend — ошибки по неделям и типам (столбцы как error_types),
+            week_quests — квесты по неделям.
+    """
+    quest_ids, ordinals = [], []
+    for pk, created_date in (
+        Quest.objects.filter(quest_filter(date_from, date_to, origin))
+        .order_by("pk")
+        .values_list("pk", "created_date")
+        .iterator(chunk_size=10000)
+    ):
+        quest_ids.append(pk)
+        ordinals.append(created_date.toordinal())
+    quest_ids = np.array(quest_ids, dtype=np.int64)
+    week_starts = week_start(np.array(ordinals, dtype=np.int64))
+
+    errors = int_columns(
+        QuestItem.objects.filter(
+            quest_filter(date_from, date_to, origin, "quest__"),
+            kind=QuestItem.KINDS["errors"],
+        ),
+        "quest_id",
+        Coalesce("type", Value(0)),
+    )
+    tasks = int_columns(
+        Task.objects.filter(quest_filter(date_from, date_to, origin, "quest__")),
+        "quest_id",
+        "type",
+    )
+
+    quests = len(quest_ids)
+    error_rows = np.searchsorted(quest_ids, errors[:, 0])
+    error_codes, error_columns = np.unique(errors[:, 1], return_inverse=True)
+    frequency = np.bincount(error_columns, minlength=len(error_codes))
+    error_incidence = _incidence(error_rows, error_columns, (quests, len(error_codes)))
+    cooccurrence = error_incidence.T @ error_incidence
+    errors_per_quest = np.bincount(error_rows, minlength=quests)
+
+    task_rows = np.searchsorted(quest_ids, tasks[:, 0])
+    task_codes, task_columns = np.unique(tasks[:, 1], return_inverse=True)
+    task_incidence = _incidence(task_rows, task_columns, (quests, len(task_codes)))
+    task_quests = task_incidence.sum(axis=0)
+    task_quests_with_errors = task_incidence.T @ (errors_per_quest > 0)
+    task_quest_errors = task_incidence.T @ errors_per_quest
+
+    first_week = week_starts.min() if quests else 0
+    week_rows = (week_starts - first_week) // 7
+    weeks = int(week_rows.max()) + 1 if quests else 0
+    trend = np.bincount(
+        week_rows[error_rows] * len(error_codes) + error_columns,
+        minlength=weeks * len(error_codes),
+    ).reshape(weeks, len(error_codes))
+
+    order = np.argsort(-frequency, kind="stable")
+    return {
+        "from": date_from,
+        "to": date_to,
+        "origin": origin,
+        "quests": quests,
+        "errors": len(errors),
+        "error_types": _type_names(error_codes[order]),
+        "frequency": frequency[order].tolist(),
+        "cooccurrence": cooccurrence[np.ix_(order, order)].tolist(),
+        "task_types": [
+            {
+                "type": name,
+                "tasks": int(tasks_count),
+                "quests": int(quests_count),
+                "quests_with_errors": int(with_errors),
+                "error_rate": with_errors / quests_count,
+                "errors_per_quest": errors_count / quests_count,
+            }
+            for name, tasks_count, quests_count, with_errors, errors_count in zip(
+                _type_names(task_codes),
+                np.bincount(task_columns, minlength=len(task_codes)),
+                task_quests,
+                task_quests_with_errors,
+                task_quest_errors,
+            )
+        ],
+        "weeks": [
+            Date.fromordinal(int(first_week) + 7 * week) for week in range(weeks)
+        ],
+        "week_quests": np.bincount(week_rows, minlength=weeks).tolist(),
+        "trend": trend[:, order].tolist(),
+    }
+
+
+def group_percentiles(groups, values, count: int, percentiles=PERCENTILES):
+    """
+    Перцентили values по группам за один проход: одна сортировка по (группа, значение),
+    затем линейная интерполяция внутри групп (как np.percentile по умолчанию) сразу для всех групп.
+
+    param:
+    groups (np.ndarray): номер группы 0..count-1 для каждого значения.
+    values (np.ndarray): значения.
+
+    return:
+    np.ndarray: форма (count, len(percentiles)); NaN для пустых групп.
+    """
+    result = np.full((count, len(percentiles)), np.nan)
+    if not len(values):
+        return result
+    values = values[np.lexsort((values, groups))]
+    sizes = np.bincount(groups, minlength=count)
+    starts = np.cumsum(sizes) - sizes
+    filled = sizes > 0
+    positions = (sizes[filled, None] - 1) * (np.array(percentiles) / 100)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, sizes[filled, None] - 1)
+    low_values = values[starts[filled, None] + lower]
+    high_values = values[starts[filled, None] + upper]
+    result[filled] = low_values + (positions - lower) * (high_values - low_values)
+    return result
+
+
+def _lifecycle_rows(groups, count: int, latency, week_rows, weeks: int) -> list:
+    completed = ~np.isnan(latency)
+    quests = np.bincount(groups, minlength=count)
+    done = np.bincount(groups[completed], minlength=count)
+    percentiles = group_percentiles(groups[completed], latency[completed], count)
+    per_week = np.bincount(
+        groups[completed] * weeks + week_rows[completed], minlength=count * weeks
+    ).reshape(count, weeks)
+    return [
+        {
+            "quests": int(quests[group]),
+            "completed": int(done[group]),
+            "never_completed_share": (
+                1 - done[group] / quests[group] if quests[group] else None
+            ),
+            **{
+                f"p{percentile}_s": None if np.isnan(value) else round(float(value))
+                for percentile, value in zip(PERCENTILES, percentiles[group])
+            },
+            "completed_per_week": per_week[group].tolist(),
+        }
+        for group in range(count)
+    ]
+
+
+def latency_report(date_from: Date, date_to: Date) -> dict:
+    """
+    Жизненный цикл квестов периода: перцентили времени до завершения (completed_at - created_at),
+    доля так и не завершённых и число завершённых по неделям (по дате завершения) —
+    всего, по источникам и по типам задач (квест входит в группу каждого типа своих задач).
+    Все группы считаются на одних массивах из values_list, без запросов на группу.
+
+    return:
+    dict: weeks — понедельники недель; total, origins, task_types — строки с quests, completed,
+        never_completed_share, p50_s/p90_s/p99_s (секунды) и completed_per_week.
+    """
+    quest_ids, origin_ids, latency, completion_days = [], [], [], []
+    for pk, origin_id, created_at, completed_at in (
+        Quest.objects.filter(quest_filter(date_from, date_to))
+        .order_by("pk")
+        .values_list("pk", "origin", "created_at", "completed_at")
+        .iterator(chunk_size=10000)
+    ):
+        quest_ids.append(pk)
+        origin_ids.append(origin_id or 0)
+        if completed_at is None:
+            latency.append(np.nan)
+            completion_days.append(0)
+        else:
+            latency.append((completed_at - created_at).total_seconds())
+            completion_days.append(localtime(completed_at).date().toordinal())
+    quest_ids = np.array(quest_ids, dtype=np.int64)
+    latency = np.array(latency, dtype=np.float64)
+    completed = ~np.isnan(latency)
+    week_starts = week_start(np.array(completion_days, dtype=np.int64))
+    first_week = week_starts[completed].min() if completed.any() else 0
+    week_rows = np.where(completed, (week_starts - first_week) // 7, 0)
+    weeks = int(week_rows.max()) + 1 if completed.any() else 0
+
+    origin_codes, origin_groups = np.unique(
+        np.array(origin_ids, dtype=np.int64), return_inverse=True
+    )
+    names = dict(
+        Origin.objects.filter(pk__in=origin_codes.tolist()).values_list("pk", "name")
+    )
+
+    tasks = int_columns(
+        Task.objects.filter(quest_filter(date_from, date_to, prefix="quest__")),
+        "quest_id",
+        "type",
+    )
+    task_codes, task_columns = np.unique(tasks[:, 1], return_inverse=True)
+    # пары (квест, тип задачи) без повторов: квест с тремя задачами одного типа считается один раз
+    pairs = np.unique(
+        np.searchsorted(quest_ids, tasks[:, 0]) * len(task_codes) + task_columns
+    )
+    pair_rows, pair_groups = np.divmod(pairs, max(len(task_codes), 1))
+
+    return {
+        "from": date_from,
+        "to": date_to,
+        "weeks": [
+            Date.fromordinal(int(first_week) + 7 * week) for week in range(weeks)
+        ],
+        "total": _lifecycle_rows(
+            np.zeros(len(quest_ids), dtype=np.int64), 1, latency, week_rows, weeks
+        )[0],
+        "origins": [
+            {"id": int(code) or None, "name": names.get(int(code)), **row}
+            for code, row in zip(
+                origin_codes,
+                _lifecycle_rows(
+                    origin_groups, len(origin_codes), latency, week_rows, weeks
+                ),
+            )
+        ],
+        "task_types": [
+            {"type": name, **row}
+            for name, row in zip(
+                _type_names(task_codes),
+                _lifecycle_rows(
+                    pair_groups,
+                    len(task_codes),
+                    latency[pair_rows],
+                    week_rows[pair_rows],
+                    weeks,
+                ),
+            )
+        ],
+    }
+
+
+def cached_report(report, *args) -> dict:
+    """
+    Отчёт report(*args) из кэша (CACHES["default"]). Ключ включает data_version(), поэтому
+    после записи квеста или источника отчёт пересчитывается, а старые записи истекают по таймауту.
+    """
+    key = f"{report.__name__}:{data_version()}:" + ":".join(map(str, args))
+    result = cache.get(key)
+    if result is None:
+        result = report(*args)
+        cache.set(key, result)
+    return result
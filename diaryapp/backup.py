@@ -0,0 +1,272 @@
+from json import dumps, loads
+from typing import Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.db.transaction import atomic
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .analytics import bump_data_version
+from .bulk import bulk_insert
+from .item_types import item_types
+from .models import Day, Origin, Quest, QuestItem, Task
+from .statistics import DayStatsDelta
+
+# Формат выгрузки — NDJSON, одна запись на строку, у каждой записи ровно один ключ:
+#   {"origin": {...}} — все источники (в том числе без квестов), в начале файла;
+#   {"quest": {...}}  — квест с задачами, ошибками, проблемами, знаниями и источником;
+#   {"day": {...}}    — заметка дня.
+ORIGIN_FIELDS = "name", "status", "origin", "weight"
+ORIGIN_DATETIME_FIELDS = "created_at", "last_extracted_at", "due_at"
+QUEST_DATETIME_FIELDS = "created_at", "completed_at", "last_update"
+
+
+def _dumps(record: dict) -> str:
+    return dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def origin_record(origin: Origin) -> dict:
+    return {
+        field: getattr(origin, field)
+        for field in ORIGIN_FIELDS + ORIGIN_DATETIME_FIELDS
+    }
+
+
+def quest_record(quest: Quest) -> dict:
+    record = {field: getattr(quest, field) for field in QUEST_DATETIME_FIELDS}
+    record["created_date"] = quest.created_date
+    record["theme"] = quest.theme
+    record["origin"] = origin_record(quest.origin) if quest.origin else None
+    record["tasks"] = [
+        {
+            "text": task.text,
+            "type": item_types.name(task.type_id),
+            "status": task.status,
+        }
+        for task in quest.tasks.all()
+    ]
+    for key, items in quest.items_by_kind.items():
+        record[key] = [
+            {"type": item_types.name(item.type_id), "text": item.text} for item in items
+        ]
+    return record
+
+
+def export_lines(chunk_size: int = 1000) -> Iterator[str]:
+    """
+    Выгружает дневник построчно. Квесты читаются .iterator() порциями по chunk_size
+    вместе с prefetch задач и элементов, поэтому память не зависит от объёма истории.
+
+    return:
+    Iterator[str]: строки NDJSON (с переводом строки).
+    """
+    for origin in Origin.objects.order_by("pk").iterator(chunk_size=chunk_size):
+        yield _dumps({"origin": origin_record(origin)})
+    quests = (
+        Quest.objects.select_related("origin")
+        .prefetch_related(
+            Prefetch("tasks", queryset=Task.objects.order_by("pk")), "items"
+        )
+        .order_by("pk")
+    )
+    for quest in quests.iterator(chunk_size=chunk_size):
+        yield _dumps({"quest": quest_record(quest)})
+    for day in Day.objects.order_by("pk").iterator(chunk_size=chunk_size):
+        yield _dumps(
+            {
+                "day": {
+                    "created_at": day.created_at,
+                    "created_date": day.created_date,
+                    "content": day.content,
+                }
+            }
+        )
+
+
+def merge_content(content: str | None, extra: str | None) -> str | None:
+    """
+    Дописывает заметку дня к имеющейся через пустую строку; уже содержащийся текст не повторяется
+    (повторная загрузка той же выгрузки ничего не меняет).
+    """
+    if not extra or extra in (content or ""):
+        return content
+    if not content:
+        return extra
+    return f"{content}\n\n{extra}"
+
+
+class DiaryImport:
+    """
+    Загрузка выгрузки export_lines: записи копятся в пакеты по batch_size квестов (или дней)
+    и пишутся bulk_insert (COPY на PostgreSQL), в памяти держится только текущий пакет.
+    Источники сопоставляются по имени: существующие не меняются, новые создаются.
+    Квесты добавляются к имеющимся (для восстановления загружайте в пустую базу).
+    Заметка дня одна на дату: заметка выгрузки дописывается к уже сохранённой за тот же день.
+    Типы, которых нет в types.json (удалены после выгрузки), добавляются в справочник ItemType.
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+        self.origins = dict(Origin.objects.values_list("name", "pk"))
+        self.quests = []
+        self.days = {}
+        self.counts = {"origins": 0, "quests": 0, "days": 0, "days merged": 0}
+
+    def load(self, lines: Iterable[str]) -> dict:
+        """
+        Загружает все строки одной транзакцией; ошибка в любой строке откатывает всю загрузку.
+
+        return:
+        dict: количество созданных источников, квестов и дней; days merged — дней, дописанных к сохранённым.
+        """
+        try:
+            with atomic():
+                for number, line in enumerate(lines, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        self.add(loads(line))
+                    except (ValueError, KeyError, TypeError, AttributeError) as exc:
+                        raise ValueError(f"line {number}: {exc!r}") from exc
+                self.flush_quests()
+                self.flush_days()
+                bump_data_version()
+        except Exception:
+            # добавленные загрузкой типы откатились вместе с ней
+            item_types.clear()
+            raise
+        return self.counts
+
+    def add(self, record: dict):
+        (kind, data), *rest = record.items()
+        if rest:
+            raise ValueError("record must have exactly one key")
+        if kind == "origin":
+            self.origin_id(data)
+        elif kind == "quest":
+            self.quests.append(self.build_quest(data))
+            if len(self.quests) >= self.batch_size:
+                self.flush_quests()
+        elif kind == "day":
+            date = parse_date(data["created_date"])
+            if date in self.days:
+                day = self.days[date]
+                day.content = merge_content(day.content, data["content"])
+            else:
+                self.days[date] = Day(
+                    created_at=parse_datetime(data["created_at"]),
+                    created_date=date,
+                    content=data["content"],
+                )
+            if len(self.days) >= self.batch_size:
+                self.flush_days()
+        else:
+            raise ValueError(f"unknown record {kind}")
+
+    def origin_id(self, data: dict | None) -> int | None:
+        if data is None:
+            return None
+        if data["name"] not in self.origins:
+            origin = Origin(**{field: data[field] for field in ORIGIN_FIELDS})
+            origin.save()
+            # created_at — auto_now_add, поэтому исходное значение записывается вторым запросом
+            Origin.objects.filter(pk=origin.pk).update(
+                **{
+                    field: data[field] and parse_datetime(data[field])
+                    for field in ORIGIN_DATETIME_FIELDS
+                }
+            )
+            self.origins[data["name"]] = origin.pk
+            self.counts["origins"] += 1
+        return self.origins[data["name"]]
+
+    @staticmethod
+    def type_id(section: str, name: str | None) -> int | None:
+        if not name:
+            return None
+        try:
+            return item_types.id(section, name)
+        except KeyError:
+            return item_types.add(section, name)
+
+    def build_quest(self, data: dict) -> Quest:
+        quest = Quest(
+            created_date=parse_date(data["created_date"]),
+            origin_id=self.origin_id(data["origin"]),
+            theme=data["theme"],
+            **{
+                field: data[field] and parse_datetime(data[field])
+                for field in QUEST_DATETIME_FIELDS
+            },
+        )
+        quest.import_tasks = [
+            Task(
+                text=task["text"],
+                type_id=self.type_id("tasks", task["type"]),
+                status=task["status"],
+            )
+            for task in data["tasks"]
+        ]
+        quest.import_items = [
+            QuestItem(
+                kind=kind, type_id=self.type_id(key, item["type"]), text=item["text"]
+            )
+            for key, kind in QuestItem.KINDS.items()
+            for item in data.get(key, ())
+        ]
+        quest.tasks_total = len(quest.import_tasks)
+        quest.tasks_done = sum(1 for task in quest.import_tasks if task.status)
+        for item in quest.import_items:
+            counter = Quest.counter(item.key)
+            setattr(quest, counter, getattr(quest, counter) + 1)
+        return quest
+
+    def flush_quests(self):
+        if not self.quests:
+            return
+        bulk_insert(Quest, self.quests)
+        tasks, items = [], []
+        delta = DayStatsDelta()
+        for quest in self.quests:
+            delta.add_quest(quest.created_date, bool(quest.completed_at))
+            for task in quest.import_tasks:
+                task.quest = quest
+                tasks.append(task)
+                delta.add_task(quest.created_date, task.type_id, task.status)
+            for item in quest.import_items:
+                item.quest = quest
+                items.append(item)
+                delta.add_item(quest.created_date, item.key, item.type_id)
+        bulk_insert(Task, tasks)
+        bulk_insert(QuestItem, items)
+        delta.apply()
+        self.counts["quests"] += len(self.quests)
+        self.quests = []
+
+    def flush_days(self):
+        """
+        Дописывает заметки к сохранённым за те же даты (одним bulk_update), для остальных дат
+        создаёт дни. Если за дату уже есть несколько строк, дописывается к первой.
+        """
+        if not self.days:
+            return
+        existing = {}
+        for day in Day.objects.filter(created_date__in=self.days).order_by("-pk"):
+            existing[day.created_date] = day
+        to_create = []
+        to_update = []
+        for date, day in self.days.items():
+            stored = existing.get(date)
+            if stored is None:
+                to_create.append(day)
+                continue
+            content = merge_content(stored.content, day.content)
+            if content != stored.content:
+                stored.content = content
+                to_update.append(stored)
+        bulk_insert(Day, to_create)
+        if to_update:
+            Day.objects.bulk_update(to_update, ("content",))
+        self.counts["days"] += len(to_create)
+        self.counts["days merged"] += len(self.days) - len(to_create)
+        self.days = {}
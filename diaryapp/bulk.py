@@ -0,0 +1,49 @@
+from django.db import connection
+
+
+def bulk_insert(model, objs: list) -> list:
+    """
+    Вставляет новые объекты пачкой и проставляет им pk, как bulk_create.
+
+    На PostgreSQL строки идут одним COPY ... FROM STDIN: id заранее берутся из последовательности
+    таблицы (COPY не возвращает значений), поэтому на объекты можно сразу ссылаться по FK.
+    На остальных базах — обычный bulk_create.
+
+    param:
+    model (Type[Model]): модель без многотабличного наследования.
+    objs (List[Model]): несохранённые объекты.
+
+    return:
+    List[Model]: те же объекты.
+    """
+    if connection.vendor != "postgresql" or not objs:
+        return model.objects.bulk_create(objs)
+    opts = model._meta
+    quote = connection.ops.quote_name
+    fields = [field for field in opts.concrete_fields if field != opts.pk]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) "
+            "FROM generate_series(1, %s)",
+            [opts.db_table, opts.pk.column, len(objs)],
+        )
+        for obj, (pk,) in zip(objs, cursor.fetchall()):
+            obj.pk = pk
+        columns = ", ".join(quote(field.column) for field in [opts.pk, *fields])
+        with cursor.copy(f"COPY {quote(opts.db_table)} ({columns}) FROM STDIN") as copy:
+            for obj in objs:
+                copy.write_row(
+                    [
+                        obj.pk,
+                        *(
+                            field.get_db_prep_save(
+                                field.pre_save(obj, add=True), connection
+                            )
+                            for field in fields
+                        ),
+                    ]
+                )
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = connection.alias
+    return objs
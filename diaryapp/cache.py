@@ -0,0 +1,102 @@
+from threading import Lock
+
+from django.core.cache import caches
+from django.db.transaction import on_commit
+
+from .models import TYPES
+
+
+def quest_updated_at(quest, types=None):
+    """
+    Момент последнего изменения представления квеста (с учётом types.json, который встраивается в ответ).
+    """
+    types = types or TYPES.snapshot()
+    return max(quest.last_update or quest.created_at, types.last_modified)
+
+
+def quest_version(quest, types=None) -> str:
+    types = types or TYPES.snapshot()
+    return f"{quest_updated_at(quest, types).timestamp()}-{types.hash[:16]}"
+
+
+class QuestRepresentationCache:
+    """
+    Кэш сериализованных квестов (QuestEditModelSerializer(...).data).
+
+    Запись хранится под ключом id квеста вместе с версией (quest_version); запись с другой
+    версией считается промахом. Работает с любым бэкендом django.core.cache (см. CACHES).
+    Счётчики попаданий/промахов считаются в пределах процесса.
+    """
+
+    key_prefix = "quest-representation"
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, pk: int) -> str:
+        return f"{self.key_prefix}:{pk}"
+
+    def get(self, quest, build, types=None):
+        """
+        param:
+        quest (Quest): квест, для которого нужно представление.
+        build (Callable[[Quest, TypesSnapshot], dict]): строит представление при промахе.
+        types (TypesSnapshot): снимок типов запроса; по умолчанию текущий.
+        """
+        types = types or TYPES.snapshot()
+        data = self.lookup(quest, types)
+        if data is None:
+            data = build(quest, types)
+            self.store(quest, data, types)
+        return data
+
+    def lookup(self, quest, types=None):
+        """
+        return:
+        dict | None: сохранённое представление актуальной версии.
+        """
+        entry = self.cache.get(self.key(quest.pk))
+        if entry is not None and entry[0] == quest_version(quest, types):
+            self._count(hit=True)
+            return entry[1]
+        self._count(hit=False)
+        return None
+
+    def store(self, quest, data, types=None):
+        self.cache.set(self.key(quest.pk), (quest_version(quest, types), data))
+
+    def invalidate(self, *pks: int):
+        """
+        Удаляет записи после фиксации текущей транзакции (или сразу, если транзакции нет).
+        """
+        keys = [self.key(pk) for pk in pks]
+        if keys:
+            on_commit(lambda: self.cache.delete_many(keys))
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "backend": self.cache.__class__.__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else None,
+        }
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+quest_cache = QuestRepresentationCache()
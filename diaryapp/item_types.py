@@ -0,0 +1,80 @@
+from threading import Lock
+
+from .models import ItemType, TYPES
+
+
+class ItemTypeCodes:
+    """
+    Справочник типов (ItemType) в памяти процесса: (раздел, имя) <-> id без запросов на пути запроса.
+
+    Справочник перечитывается из базы при промахе. Тип, который есть в types.json, но ещё
+    не попал в базу (types.json перезагружается на лету), добавляется при первом обращении.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._names = {}
+        self._lock = Lock()
+
+    def id(self, section: str, name: str | None) -> int | None:
+        """
+        param:
+        section (str): раздел types.json (tasks, errors, problems, knowledge).
+        name (str): ключ типа; пустое значение означает «без типа».
+
+        return:
+        int | None: id строки ItemType.
+        """
+        if not name:
+            return None
+        key = section, name
+        if key not in self._ids:
+            self.load()
+        if key not in self._ids:
+            self.sync(section)
+        return self._ids[key]
+
+    def name(self, pk: int | None) -> str | None:
+        if pk is None:
+            return None
+        if pk not in self._names:
+            self.load()
+        return self._names[pk][1]
+
+    def sync(self, section: str):
+        """
+        Добавляет в справочник типы раздела из текущего types.json, которых там ещё нет.
+        """
+        ItemType.objects.bulk_create(
+            [ItemType(section=section, name=name) for name in TYPES[section]],
+            ignore_conflicts=True,
+        )
+        self.load()
+
+    def add(self, section: str, name: str) -> int:
+        """
+        Добавляет в справочник тип не из types.json (например, из выгрузки, сделанной до удаления типа),
+        как миграция 0025 — типы, уже встречавшиеся в строках.
+
+        return:
+        int: id строки ItemType.
+        """
+        ItemType.objects.bulk_create(
+            [ItemType(section=section, name=name)], ignore_conflicts=True
+        )
+        self.load()
+        return self._ids[section, name]
+
+    def load(self):
+        rows = list(ItemType.objects.values_list("pk", "section", "name"))
+        with self._lock:
+            self._ids = {(section, name): pk for pk, section, name in rows}
+            self._names = {pk: (section, name) for pk, section, name in rows}
+
+    def clear(self):
+        with self._lock:
+            self._ids = {}
+            self._names = {}
+
+
+item_types = ItemTypeCodes()
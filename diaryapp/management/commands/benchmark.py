@@ -0,0 +1,406 @@
+from datetime import timedelta
+from json import dumps
+from pathlib import Path
+from random import Random
+from statistics import median
+from tempfile import TemporaryDirectory
+from threading import Barrier, Thread
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections
+from django.test import RequestFactory, override_settings
+from django.utils.timezone import localdate, now
+
+from diaryapp.analytics import cached_report, error_report, latency_report
+from diaryapp.models import Origin, TYPES
+from diaryapp.retry import write_retry
+from diaryapp.views import QuestApi, get_calendar, get_quests, post_quests_batch
+
+
+def measure(func, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        func()
+        timings.append((perf_counter() - started) * 1000)
+    return {"min_ms": min(timings), "median_ms": median(timings)}
+
+
+def bench_calendar(command, options):
+    call_command("seed", years=options["years"], stdout=command.stdout)
+    date_to = localdate()
+    date_from = date_to.replace(year=date_to.year - options["years"])
+    request = RequestFactory().get(
+        "/api/calendar", {"from": date_from.isoformat(), "to": date_to.isoformat()}
+    )
+
+    def run():
+        response = get_calendar(request)
+        response.render()
+
+    return {
+        f"calendar {options['years']} years": measure(run, options["repeat"]),
+    }
+
+
+def bench_origins(command, options):
+    rng = Random(0)
+    started = now()
+    origins = []
+    for i in range(options["origins"]):
+        origin = Origin(
+            name=f"origin {i}",
+            status=rng.choice("aaaf"),
+            weight=rng.randint(1, 5),
+            last_extracted_at=started - timedelta(minutes=rng.randint(1, 10**6)),
+        )
+        origin.due_at = origin.last_extracted_at + timedelta(
+            minutes=rng.randint(0, 24 * 60) / origin.weight
+        )
+        origins.append(origin)
+    Origin.objects.bulk_create(origins, batch_size=1000)
+
+    def three_queries():
+        # прежний _extract_actual_origin: новые актуальные -> любые актуальные -> замороженные
+        return (
+            Origin.objects.filter(status="a", last_extracted_at=None)
+            .order_by("created_at")
+            .first()
+            or Origin.objects.filter(status="a").first()
+            or Origin.objects.filter(status="f").first()
+        )
+
+    results = {
+        f"origins {options['origins']} three queries": measure(
+            three_queries, options["repeat"]
+        )
+    }
+    for mode in ("priority", "weighted"):
+        with override_settings(ORIGIN_ROTATION=mode):
+            results[f"origins {options['origins']} {mode}"] = measure(
+                Origin.next_for_quest, options["repeat"]
+            )
+    return results
+
+
+def bench_batch(command, options):
+    rng = Random(0)
+    origins = Origin.objects.bulk_create(
+        [Origin(name=f"origin {i}", status="a") for i in range(20)]
+    )
+    task_types = list(TYPES["tasks"])
+
+    def quest():
+        return {
+            "theme": "benchmark",
+            "origin": rng.choice(origins).pk,
+            "tasks": [
+                {"text": f"task {i}", "type": rng.choice(task_types)}
+                for i in range(rng.randint(1, 5))
+            ],
+        }
+
+    factory = RequestFactory()
+    results = {}
+    for size in (1, 100, 10000):
+        body = dumps([quest() for _ in range(size)])
+
+        def run():
+            request = factory.post(
+                "/api/quests/batch", body, content_type="application/json"
+            )
+            response = post_quests_batch(request)
+            assert response.status_code == 201, response.data
+
+        result = measure(run, options["repeat"] if size <= 100 else 3)
+        result["quests_per_s"] = size / result["median_ms"] * 1000
+        results[f"batch {size}"] = result
+
+    # тот же объём по одному квесту через api/quest/create — для сравнения
+    bodies = [dumps(quest()) for _ in range(100)]
+    view = QuestApi.as_view()
+
+    def one_by_one():
+        for body in bodies:
+            request = factory.post(
+                "/api/quest/create", body, content_type="application/json"
+            )
+            assert view(request).status_code == 201
+
+    result = measure(one_by_one, 3)
+    result["quests_per_s"] = len(bodies) / result["median_ms"] * 1000
+    results["single x100"] = result
+    return results
+
+
+def bench_analytics(command, options):
+    call_command("seed", years=options["years"], stdout=command.stdout)
+    date_to = localdate()
+    date_from = date_to.replace(year=date_to.year - options["years"])
+    results = {}
+    for report in (error_report, latency_report):
+
+        def cold():
+            cache.clear()
+            cached_report(report, date_from, date_to)
+
+        def warm():
+            cached_report(report, date_from, date_to)
+
+        name = f"{report.__name__} {options['years']} years"
+        results[f"{name} cold"] = measure(cold, options["repeat"])
+        results[f"{name} cached"] = measure(warm, options["repeat"])
+    return results
+
+
+def use_database(settings_dict: dict, profile: dict):
+    """
+    Переключает ENGINE/OPTIONS соединения по умолчанию: соединение текущего потока
+    пересоздаётся, остальные потоки откроют свои уже с новыми настройками.
+    """
+    connection.close()
+    del connections[DEFAULT_DB_ALIAS]
+    settings_dict.update(profile)
+
+
+def run_threads(jobs: dict, operations: int) -> dict:
+    """
+    Запускает потоки одновременно, каждый со своим соединением; «database is locked»
+    (и другие OperationalError) считаются ошибками, остальные исключения пробрасываются.
+
+    param:
+    jobs (Dict[str, List[Tuple[Callable[[int], None], List[int]]]]): по виду нагрузки —
+        операции потоков и id квестов, по которым операция проходит по кругу.
+    operations (int): число операций на поток.
+
+    return:
+    Dict[str, dict]: по виду нагрузки — операций в секунду, ошибки, медиана и максимум (мс).
+    """
+    stats = {kind: [] for kind in jobs}
+    failures = []
+    threads = []
+
+    def worker(operation, pks, thread_stats, barrier):
+        barrier.wait()
+        try:
+            for i in range(operations):
+                started = perf_counter()
+                try:
+                    operation(pks[i % len(pks)])
+                except OperationalError:
+                    thread_stats["errors"] += 1
+                else:
+                    thread_stats["timings"].append((perf_counter() - started) * 1000)
+        except Exception as exc:
+            failures.append(exc)
+        finally:
+            connections.close_all()
+
+    barrier = Barrier(sum(len(kind_jobs) for kind_jobs in jobs.values()) + 1)
+    for kind, kind_jobs in jobs.items():
+        for operation, pks in kind_jobs:
+            thread_stats = {"errors": 0, "timings": []}
+            stats[kind].append(thread_stats)
+            threads.append(
+                Thread(target=worker, args=(operation, pks, thread_stats, barrier))
+            )
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+    if failures:
+        raise failures[0]
+    results = {}
+    for kind, kind_stats in stats.items():
+        timings = [ms for item in kind_stats for ms in item["timings"]]
+        results[kind] = {
+            "per_s": len(timings) / elapsed,
+            "errors": sum(item["errors"] for item in kind_stats),
+            "median_ms": median(timings) if timings else 0,
+            "max_ms": max(timings, default=0),
+        }
+    return results
+
+
+class QuestWorkload:
+    """
+    Квесты для потоков и операции над ними через те же view, что и у клиентов.
+    """
+
+    def __init__(self, count: int):
+        self.factory = RequestFactory()
+        self.origins = Origin.objects.bulk_create(
+            [Origin(name=f"origin {i}", status="a") for i in range(10)]
+        )
+        self.task_types = list(TYPES["tasks"])
+        body = dumps([self.quest(i) for i in range(count)])
+        response = post_quests_batch(
+            self.factory.post(
+                "/api/quests/batch", body, content_type="application/json"
+            )
+        )
+        self.quests = [result["id"] for result in response.data["results"]]
+        self.view = QuestApi.as_view()
+
+    def quest(self, i: int) -> dict:
+        return {
+            "theme": "benchmark",
+            "origin": self.origins[i % len(self.origins)].pk,
+            "tasks": [
+                {"text": f"task {j}", "type": self.task_types[j % len(self.task_types)]}
+                for j in range(3)
+            ],
+        }
+
+    def save(self, pk: int):
+        """
+        Сохранение из вкладки редактора: GET квеста и PUT с переключённым статусом задачи.
+        """
+        data = self.view(self.factory.get(f"/api/quest/{pk}"), pk=pk).data
+        data["tasks"][0]["status"] = int(not data["tasks"][0]["status"])
+        request = self.factory.put(
+            f"/api/quest/{pk}", dumps(data), content_type="application/json"
+        )
+        response = self.view(request, pk=pk)
+        assert response.status_code == 200, response.data
+
+    def create(self, pk: int):
+        request = self.factory.post(
+            "/api/quest/create", dumps(self.quest(pk)), content_type="application/json"
+        )
+        response = self.view(request)
+        assert response.status_code == 201, response.data
+
+    def read(self, pk: int):
+        request = self.factory.get("/api/quests", {"origin": self.origins[0].pk})
+        response = get_quests(request)
+        assert response.status_code == 200, response.data
+
+
+def bench_concurrency(command, options):
+    """
+    Сохранения квестов (как вкладка редактора) и чтение истории (api/quests) из параллельных
+    потоков: стандартный бэкенд SQLite (журнал отката, BEGIN DEFERRED) против бэкенда из DATABASES
+    (на PostgreSQL — только бэкенд из DATABASES).
+    """
+    workload = QuestWorkload(options["writers"] * 10)
+    settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+    configured = {key: settings_dict[key] for key in ("ENGINE", "OPTIONS")}
+    profiles = {configured["ENGINE"]: configured}
+    if connection.vendor == "sqlite":
+        profiles = {
+            "django.db.backends.sqlite3": {
+                "ENGINE": "django.db.backends.sqlite3",
+                "OPTIONS": {},
+            },
+            **profiles,
+        }
+    jobs = {
+        "writes": [
+            (workload.save, workload.quests[i :: options["writers"]])
+            for i in range(options["writers"])
+        ],
+        "reads": [(workload.read, workload.quests)] * options["readers"],
+    }
+    results = {}
+    try:
+        for name, profile in profiles.items():
+            use_database(settings_dict, profile)
+            if not profile["OPTIONS"]:
+                with connection.cursor() as cursor:
+                    # режим журнала сохраняется в файле базы
+                    cursor.execute("PRAGMA journal_mode = DELETE")
+            for kind, result in run_threads(jobs, options["operations"]).items():
+                results[f"concurrency {name} {kind}"] = result
+    finally:
+        use_database(settings_dict, configured)
+    return results
+
+
+def bench_retry(command, options):
+    """
+    Стресс пишущих потоков (сохранения одних и тех же квестов и создание новых) без ожидания
+    блокировки в SQLite (busy_timeout = 0), чтобы каждый конфликт доходил до приложения:
+    без повторов (WRITE_RETRY_ATTEMPTS = 1) и с повторами из настроек.
+    """
+    if connection.vendor != "sqlite":
+        raise CommandError("The retry scenario needs SQLite (it sets busy_timeout = 0)")
+    workload = QuestWorkload(10)
+    settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+    configured = {key: settings_dict[key] for key in ("ENGINE", "OPTIONS")}
+    pragmas = {**configured["OPTIONS"].get("pragmas", {}), "busy_timeout": 0}
+    jobs = {
+        "saves": [(workload.save, workload.quests)] * options["writers"],
+        "creates": [(workload.create, workload.quests)] * options["writers"],
+    }
+    results = {}
+    try:
+        use_database(
+            settings_dict,
+            {
+                "ENGINE": configured["ENGINE"],
+                "OPTIONS": {**configured["OPTIONS"], "pragmas": pragmas},
+            },
+        )
+        for attempts in (1, settings.WRITE_RETRY_ATTEMPTS):
+            write_retry.reset_stats()
+            with override_settings(WRITE_RETRY_ATTEMPTS=attempts):
+                threads = run_threads(jobs, options["operations"])
+            for kind, result in threads.items():
+                results[f"retry attempts={attempts} {kind}"] = result
+            results[f"retry attempts={attempts} stats"] = write_retry.stats()
+    finally:
+        use_database(settings_dict, configured)
+    return results
+
+
+SCENARIOS = {
+    "calendar": bench_calendar,
+    "origins": bench_origins,
+    "batch": bench_batch,
+    "analytics": bench_analytics,
+    "concurrency": bench_concurrency,
+    "retry": bench_retry,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a benchmark scenario against a throwaway database "
+        "(a temporary SQLite file, or test_<NAME> on PostgreSQL)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=SCENARIOS)
+        parser.add_argument("--years", type=int, default=5)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--origins", type=int, default=5000)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--operations", type=int, default=50)
+
+    def handle(self, *args, scenario, **options):
+        with TemporaryDirectory() as directory:
+            if connection.vendor == "sqlite":
+                connection.settings_dict["TEST"]["NAME"] = str(
+                    Path(directory) / "benchmark.sqlite3"
+                )
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                results = SCENARIOS[scenario](self, options)
+            finally:
+                connection.creation.destroy_test_db(
+                    connection.settings_dict["NAME"], verbosity=0
+                )
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name}: "
+                + ", ".join(f"{key}={value:.2f}" for key, value in result.items())
+            )
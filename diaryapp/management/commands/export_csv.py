@@ -0,0 +1,52 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import localdate
+
+from diaryapp.analytics import csv_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Export one CSV row per task and per error (date, origin, theme, type, status, "
+        "time to complete) for offline analysis"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", nargs="?", help="Output file (default: standard output)"
+        )
+        parser.add_argument(
+            "--from",
+            dest="date_from",
+            type=date.fromisoformat,
+            default=date.min,
+            help="First quest creation date, YYYY-MM-DD (default: all history)",
+        )
+        parser.add_argument(
+            "--to",
+            dest="date_to",
+            type=date.fromisoformat,
+            default=None,
+            help="Last quest creation date, YYYY-MM-DD (default: today)",
+        )
+        parser.add_argument("--origin", type=int, default=None, help="Origin id")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Rows fetched from the database at a time",
+        )
+
+    def handle(self, *args, path, date_from, date_to, origin, chunk_size, **options):
+        lines = csv_lines(date_from, date_to or localdate(), origin, chunk_size)
+        if path is None:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        rows = -1
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            for line in lines:
+                file.write(line)
+                rows += 1
+        self.stdout.write(self.style.SUCCESS(f"Exported {rows} rows to {path}"))
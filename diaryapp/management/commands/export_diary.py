@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from diaryapp.backup import export_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream the whole diary as NDJSON: origins, one line per quest "
+        "with its tasks, errors, problems, knowledge and origin, then day notes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", nargs="?", help="Output file (default: standard output)"
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Quests fetched (with their tasks and items) per query",
+        )
+
+    def handle(self, *args, path: str | None, chunk_size: int, **options):
+        if path is None:
+            for line in export_lines(chunk_size):
+                self.stdout.write(line, ending="")
+            return
+        lines = 0
+        with open(path, "w", encoding="utf-8") as file:
+            for line in export_lines(chunk_size):
+                file.write(line)
+                lines += 1
+        self.stdout.write(self.style.SUCCESS(f"Exported {lines} lines to {path}"))
@@ -0,0 +1,38 @@
+from sys import stdin
+
+from django.core.management.base import BaseCommand, CommandError
+
+from diaryapp.backup import DiaryImport
+
+
+class Command(BaseCommand):
+    help = (
+        "Load an NDJSON file written by export_diary in fixed-size bulk batches "
+        "(all or nothing: any bad line rolls the whole import back)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or - for standard input")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Quests (or day notes) written per bulk insert (COPY on PostgreSQL)",
+        )
+
+    def handle(self, *args, path: str, batch_size: int, **options):
+        importer = DiaryImport(batch_size)
+        try:
+            if path == "-":
+                counts = importer.load(stdin)
+            else:
+                with open(path, encoding="utf-8") as file:
+                    counts = importer.load(file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Imported "
+                + ", ".join(f"{count} {name}" for name, count in counts.items())
+            )
+        )
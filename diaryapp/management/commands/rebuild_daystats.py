@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Min, Max
+from django.db.transaction import atomic
+
+from diaryapp.models import Quest, DayStats
+from diaryapp.statistics import rebuild_day_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the DayStats rollup from quests, one transaction per batch of days"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-days",
+            type=int,
+            default=31,
+            help="Number of days recalculated per transaction",
+        )
+
+    def handle(self, *args, batch_days: int, **options):
+        bounds = Quest.objects.aggregate(
+            date_from=Min("created_date"), date_to=Max("created_date")
+        )
+        date_from, date_to = bounds["date_from"], bounds["date_to"]
+        if date_from is None:
+            DayStats.objects.all().delete()
+            self.stdout.write("No quests, statistics cleared")
+            return
+
+        DayStats.objects.exclude(date__range=(date_from, date_to)).delete()
+        days = 0
+        step = timedelta(days=batch_days)
+        while date_from <= date_to:
+            with atomic():
+                days += rebuild_day_stats(
+                    date_from, min(date_from + step - timedelta(days=1), date_to)
+                )
+            date_from += step
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt statistics for {days} days"))
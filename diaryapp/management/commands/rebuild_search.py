@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from diaryapp.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from tasks, errors, problems, knowledge and day notes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Source rows indexed per transaction",
+        )
+
+    def handle(self, *args, batch_size: int, **options):
+        rebuild_search_index(batch_size, log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.db.transaction import atomic
+
+from diaryapp.models import Quest
+from diaryapp.statistics import recount_quests
+
+
+class Command(BaseCommand):
+    help = (
+        "Repair per-quest task and item counters, one transaction per batch of quests"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Number of quest ids checked per transaction",
+        )
+
+    def handle(self, *args, batch_size: int, **options):
+        max_id = Quest.objects.aggregate(max_id=Max("pk"))["max_id"] or 0
+        repaired = 0
+        for start in range(0, max_id, batch_size):
+            with atomic():
+                repaired += recount_quests(start, start + batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Repaired counters of {repaired} quests"))
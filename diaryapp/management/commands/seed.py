@@ -0,0 +1,125 @@
+from datetime import datetime, time, timedelta
+from random import Random
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.transaction import atomic
+from django.utils.timezone import make_aware, localdate, now
+
+from diaryapp.analytics import bump_data_version
+from diaryapp.bulk import bulk_insert
+from diaryapp.item_types import item_types
+from diaryapp.models import (
+    Quest,
+    Task,
+    QuestItem,
+    Origin,
+    Day,
+    TYPES,
+)
+
+
+class Command(BaseCommand):
+    help = "Fill the database with a synthetic multi-year diary (for benchmarks and load checks)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--years", type=int, default=5)
+        parser.add_argument("--quests-per-day", type=int, default=3)
+        parser.add_argument("--tasks-per-quest", type=int, default=4)
+        parser.add_argument("--items-per-quest", type=int, default=1)
+        parser.add_argument("--origins", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = Random(options["seed"])
+        self.options = options
+        offset = Origin.objects.count()
+        self.origins = Origin.objects.bulk_create(
+            Origin(name=f"origin {offset + i}", status=self.rng.choice("aaaf"))
+            for i in range(options["origins"])
+        )
+
+        date_to = localdate()
+        date = date_to - timedelta(days=365 * options["years"])
+        quests, days = [], []
+        total = 0
+        while date <= date_to:
+            for _ in range(self.rng.randint(0, 2 * options["quests_per_day"])):
+                quests.append(self._build_quest(date))
+            if self.rng.random() < 0.3:
+                days.append(
+                    Day(
+                        created_at=make_aware(datetime.combine(date, time())),
+                        created_date=date,
+                        content=f"note {date}",
+                    )
+                )
+            if len(quests) >= options["batch_size"]:
+                total += self._flush(quests, days)
+                quests, days = [], []
+            date += timedelta(days=1)
+        total += self._flush(quests, days)
+        bump_data_version()
+
+        call_command("rebuild_daystats", stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Seeded {total} quests"))
+
+    def _build_quest(self, date):
+        created_at = make_aware(
+            datetime.combine(
+                date, time(self.rng.randint(6, 22), self.rng.randint(0, 59))
+            )
+        )
+        completed_at = created_at + timedelta(minutes=self.rng.randint(5, 3 * 24 * 60))
+        # квесты последних дней, которые «завершились бы» в будущем, остаются открытыми
+        done = self.rng.random() < 0.7 and completed_at <= now()
+        quest = Quest(
+            created_at=created_at,
+            created_date=date,
+            origin=self.rng.choice(self.origins),
+            theme=f"theme {self.rng.randint(0, 1000)}",
+        )
+        if done:
+            quest.completed_at = completed_at
+            quest.last_update = completed_at
+        quest.seed_tasks = [
+            Task(
+                type_id=item_types.id("tasks", self.rng.choice(tuple(TYPES["tasks"]))),
+                text=f"task {i}",
+                status=1 if done else self.rng.randint(0, 1),
+            )
+            for i in range(self.options["tasks_per_quest"])
+        ]
+        quest.seed_items = [
+            QuestItem(
+                kind=kind,
+                type_id=item_types.id(key, self.rng.choice(tuple(TYPES[key]))),
+                text=f"{key} {i}",
+            )
+            for key, kind in QuestItem.KINDS.items()
+            for i in range(self.rng.randint(0, self.options["items_per_quest"]))
+        ]
+        quest.tasks_total = len(quest.seed_tasks)
+        quest.tasks_done = sum(1 for task in quest.seed_tasks if task.status)
+        for item in quest.seed_items:
+            counter = Quest.counter(item.key)
+            setattr(quest, counter, getattr(quest, counter) + 1)
+        return quest
+
+    def _flush(self, quests, days) -> int:
+        with atomic():
+            bulk_insert(Quest, quests)
+            bulk_insert(Day, days)
+            tasks = []
+            items = []
+            for quest in quests:
+                for task in quest.seed_tasks:
+                    task.quest = quest
+                    tasks.append(task)
+                for item in quest.seed_items:
+                    item.quest = quest
+                    items.append(item)
+            bulk_insert(Task, tasks)
+            bulk_insert(QuestItem, items)
+        return len(quests)
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.7 on 2026-10-18 17:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill_created_date(apps, schema_editor):
+    for model_name in ("Quest", "Day"):
+        model = apps.get_model("diaryapp", model_name)
+        batch = []
+        for obj in model.objects.only("id", "created_at").iterator(
+            chunk_size=BATCH_SIZE
+        ):
+            obj.created_date = django.utils.timezone.localdate(obj.created_at)
+            batch.append(obj)
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_update(batch, ("created_date",))
+                batch = []
+        model.objects.bulk_update(batch, ("created_date",))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diaryapp", "0018_remove_quest_theme_description_quest_theme_task_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="day",
+            name="created_date",
+            field=models.DateField(
+                db_index=True, default=django.utils.timezone.localdate
+            ),
+        ),
+        migrations.AddField(
+            model_name="quest",
+            name="created_date",
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.RunPython(backfill_created_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="quest",
+            index=models.Index(
+                fields=["created_date", "created_at"],
+                name="diaryapp_qu_created_9feddd_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:14
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+BATCH_DAYS = 31
+ITEM_MODELS = (("errors", "Error"), ("problems", "Problem"), ("knowledge", "Knowledge"))
+
+
+def backfill_day_stats(apps, schema_editor):
+    """
+    Заполняет DayStats по уже существующим квестам, как manage.py rebuild_daystats:
+    сгруппированными запросами по BATCH_DAYS дней, без обхода строк в Python.
+    Иначе первое изменение или удаление старого квеста записало бы частичные (и отрицательные) суммы.
+    """
+    Quest = apps.get_model("diaryapp", "Quest")
+    Task = apps.get_model("diaryapp", "Task")
+    DayStats = apps.get_model("diaryapp", "DayStats")
+    bounds = Quest.objects.aggregate(
+        date_from=Min("created_date"), date_to=Max("created_date")
+    )
+    date_from, date_to = bounds["date_from"], bounds["date_to"]
+    if date_from is None:
+        return
+    step = timedelta(days=BATCH_DAYS)
+    while date_from <= date_to:
+        dates = date_from, min(date_from + step - timedelta(days=1), date_to)
+        stats = defaultdict(
+            lambda: defaultdict(int, task_types=defaultdict(dict), error_types={})
+        )
+        for date, created, completed in (
+            Quest.objects.filter(created_date__range=dates)
+            .values_list("created_date")
+            .annotate(Count("id"), Count("completed_at"))
+            .order_by()
+        ):
+            stats[date]["quests_created"] = created
+            stats[date]["quests_completed"] = completed
+        for date, type_, status, count in (
+            Task.objects.filter(quest__created_date__range=dates)
+            .values_list("quest__created_date", "type", "status")
+            .annotate(Count("id"))
+            .order_by()
+        ):
+            stats[date]["tasks_total"] += count
+            if status:
+                stats[date]["tasks_done"] += count
+            stats[date]["task_types"][type_][str(status)] = count
+        for key, model_name in ITEM_MODELS:
+            for date, type_, count in (
+                apps.get_model("diaryapp", model_name)
+                .objects.filter(quest__created_date__range=dates)
+                .values_list("quest__created_date", "type")
+                .annotate(Count("id"))
+                .order_by()
+            ):
+                stats[date][key] += count
+                if key == "errors":
+                    error_types = stats[date]["error_types"]
+                    error_types[type_ or ""] = error_types.get(type_ or "", 0) + count
+        DayStats.objects.bulk_create(
+            DayStats(date=date, **fields) for date, fields in stats.items()
+        )
+        date_from += step
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diaryapp", "0019_quest_created_date_day_created_date"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DayStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(unique=True)),
+                ("quests_created", models.IntegerField(default=0)),
+                ("quests_completed", models.IntegerField(default=0)),
+                ("tasks_total", models.IntegerField(default=0)),
+                ("tasks_done", models.IntegerField(default=0)),
+                ("errors", models.IntegerField(default=0)),
+                ("problems", models.IntegerField(default=0)),
+                ("knowledge", models.IntegerField(default=0)),
+                ("task_types", models.JSONField(default=dict)),
+                ("error_types", models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.RunPython(backfill_day_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diaryapp", "0020_daystats"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="quest",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diaryapp", "0021_quest_created_at_default"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="quest",
+            index=models.Index(
+                fields=["created_at", "id"], name="diaryapp_qu_created_b9ec66_idx"
+            ),
+        ),
+    ]
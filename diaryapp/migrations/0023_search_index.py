@@ -0,0 +1,77 @@
+from django.db import migrations
+
+# rowid = id * 8 + код вида (см. diaryapp.search)
+SOURCES = (
+    (1, "diaryapp_task", "text"),
+    (2, "diaryapp_error", "text"),
+    (3, "diaryapp_problem", "text"),
+    (4, "diaryapp_knowledge", "text"),
+)
+
+
+def forwards_sql():
+    statements = [
+        "CREATE VIRTUAL TABLE diaryapp_search USING fts5("
+        "text, quest_id UNINDEXED, day UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    ]
+    for code, table, column in SOURCES:
+        statements += [
+            f"CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO diaryapp_search (rowid, text, quest_id, day) VALUES ("
+            f"NEW.id * 8 + {code}, NEW.{column}, NEW.quest_id, "
+            f"(SELECT created_date FROM diaryapp_quest WHERE id = NEW.quest_id)); END",
+            f"CREATE TRIGGER {table}_search_update AFTER UPDATE OF {column} ON {table} BEGIN "
+            f"UPDATE diaryapp_search SET text = NEW.{column} WHERE rowid = NEW.id * 8 + {code}; END",
+            f"CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM diaryapp_search WHERE rowid = OLD.id * 8 + {code}; END",
+            f"INSERT INTO diaryapp_search (rowid, text, quest_id, day) "
+            f"SELECT item.id * 8 + {code}, item.{column}, item.quest_id, quest.created_date "
+            f"FROM {table} item JOIN diaryapp_quest quest ON quest.id = item.quest_id",
+        ]
+    statements += [
+        "CREATE TRIGGER diaryapp_day_search_insert AFTER INSERT ON diaryapp_day BEGIN "
+        "INSERT INTO diaryapp_search (rowid, text, quest_id, day) VALUES ("
+        "NEW.id * 8 + 5, NEW.content, NULL, NEW.created_date); END",
+        "CREATE TRIGGER diaryapp_day_search_update AFTER UPDATE OF content ON diaryapp_day BEGIN "
+        "UPDATE diaryapp_search SET text = NEW.content WHERE rowid = NEW.id * 8 + 5; END",
+        "CREATE TRIGGER diaryapp_day_search_delete AFTER DELETE ON diaryapp_day BEGIN "
+        "DELETE FROM diaryapp_search WHERE rowid = OLD.id * 8 + 5; END",
+        "INSERT INTO diaryapp_search (rowid, text, quest_id, day) "
+        "SELECT id * 8 + 5, content, NULL, created_date FROM diaryapp_day",
+    ]
+    return statements
+
+
+def backwards_sql():
+    statements = []
+    for table in [table for _, table, _ in SOURCES] + ["diaryapp_day"]:
+        for action in ("insert", "update", "delete"):
+            statements.append(f"DROP TRIGGER IF EXISTS {table}_search_{action}")
+    statements.append("DROP TABLE IF EXISTS diaryapp_search")
+    return statements
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in forwards_sql():
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in backwards_sql():
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diaryapp", "0022_quest_created_at_id_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
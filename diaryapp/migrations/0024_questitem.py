@@ -0,0 +1,188 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# модель -> QuestItem.kind
+ITEM_MODELS = (("Error", "e"), ("Problem", "p"), ("Knowledge", "k"))
+# rowid в diaryapp_search = id * 8 + код вида (см. diaryapp.search)
+OLD_SOURCES = (
+    (2, "diaryapp_error"),
+    (3, "diaryapp_problem"),
+    (4, "diaryapp_knowledge"),
+)
+ITEM_CODE = "CASE {column} WHEN 'e' THEN 2 WHEN 'p' THEN 3 WHEN 'k' THEN 4 END"
+
+
+def copy_items(apps, schema_editor):
+    QuestItem = apps.get_model("diaryapp", "QuestItem")
+    for model_name, kind in ITEM_MODELS:
+        model = apps.get_model("diaryapp", model_name)
+        batch = []
+        for item in model.objects.order_by("pk").iterator(chunk_size=BATCH_SIZE):
+            batch.append(
+                QuestItem(
+                    kind=kind, type=item.type, text=item.text, quest_id=item.quest_id
+                )
+            )
+            if len(batch) == BATCH_SIZE:
+                QuestItem.objects.bulk_create(batch)
+                batch = []
+        QuestItem.objects.bulk_create(batch)
+
+
+def restore_items(apps, schema_editor):
+    QuestItem = apps.get_model("diaryapp", "QuestItem")
+    models_by_kind = {
+        kind: apps.get_model("diaryapp", model_name) for model_name, kind in ITEM_MODELS
+    }
+    batches = {kind: [] for kind in models_by_kind}
+    for item in QuestItem.objects.order_by("pk").iterator(chunk_size=BATCH_SIZE):
+        model = models_by_kind[item.kind]
+        batch = batches[item.kind]
+        batch.append(model(type=item.type, text=item.text, quest_id=item.quest_id))
+        if len(batch) == BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            batch.clear()
+    for kind, batch in batches.items():
+        models_by_kind[kind].objects.bulk_create(batch)
+
+
+def item_triggers_sql():
+    code = ITEM_CODE.format(column="NEW.kind")
+    return [
+        "CREATE TRIGGER diaryapp_questitem_search_insert AFTER INSERT ON diaryapp_questitem BEGIN "
+        "INSERT INTO diaryapp_search (rowid, text, quest_id, day) VALUES ("
+        f"NEW.id * 8 + {code}, NEW.text, NEW.quest_id, "
+        "(SELECT created_date FROM diaryapp_quest WHERE id = NEW.quest_id)); END",
+        "CREATE TRIGGER diaryapp_questitem_search_update AFTER UPDATE OF text ON diaryapp_questitem BEGIN "
+        f"UPDATE diaryapp_search SET text = NEW.text WHERE rowid = NEW.id * 8 + {code}; END",
+        "CREATE TRIGGER diaryapp_questitem_search_delete AFTER DELETE ON diaryapp_questitem BEGIN "
+        "DELETE FROM diaryapp_search WHERE rowid = OLD.id * 8 + "
+        f"{ITEM_CODE.format(column='OLD.kind')}; END",
+    ]
+
+
+def old_triggers_sql():
+    statements = []
+    for code, table in OLD_SOURCES:
+        statements += [
+            f"CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO diaryapp_search (rowid, text, quest_id, day) VALUES ("
+            f"NEW.id * 8 + {code}, NEW.text, NEW.quest_id, "
+            f"(SELECT created_date FROM diaryapp_quest WHERE id = NEW.quest_id)); END",
+            f"CREATE TRIGGER {table}_search_update AFTER UPDATE OF text ON {table} BEGIN "
+            f"UPDATE diaryapp_search SET text = NEW.text WHERE rowid = NEW.id * 8 + {code}; END",
+            f"CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM diaryapp_search WHERE rowid = OLD.id * 8 + {code}; END",
+        ]
+    return statements
+
+
+def old_index_rows_sql():
+    return [
+        f"INSERT INTO diaryapp_search (rowid, text, quest_id, day) "
+        f"SELECT item.id * 8 + {code}, item.text, item.quest_id, quest.created_date "
+        f"FROM {table} item JOIN diaryapp_quest quest ON quest.id = item.quest_id"
+        for code, table in OLD_SOURCES
+    ]
+
+
+def drop_item_index_rows_sql():
+    return ["DELETE FROM diaryapp_search WHERE rowid % 8 IN (2, 3, 4)"]
+
+
+def switch_search_to_items(apps, schema_editor):
+    """
+    Триггеры индекса переезжают на diaryapp_questitem до копирования строк,
+    так что copy_items заполняет индекс заново.
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    statements = [
+        f"DROP TRIGGER IF EXISTS {table}_search_{action}"
+        for _, table in OLD_SOURCES
+        for action in ("insert", "update", "delete")
+    ]
+    for statement in statements + drop_item_index_rows_sql() + item_triggers_sql():
+        schema_editor.execute(statement)
+
+
+def switch_search_to_old_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    statements = [
+        f"DROP TRIGGER IF EXISTS diaryapp_questitem_search_{action}"
+        for action in ("insert", "update", "delete")
+    ]
+    for statement in (
+        statements
+        + drop_item_index_rows_sql()
+        + old_triggers_sql()
+        + old_index_rows_sql()
+    ):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diaryapp", "0023_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QuestItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("e", "errors"),
+                            ("p", "problems"),
+                            ("k", "knowledge"),
+                        ],
+                        max_length=1,
+                    ),
+                ),
+                ("type", models.CharField(blank=True, max_length=50, null=True)),
+                ("text", models.TextField(blank=True, max_length=1000, null=True)),
+                (
+                    "quest",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="diaryapp.quest",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="questitem",
+            index=models.Index(
+                fields=["quest", "kind"], name="diaryapp_qu_quest_i_527679_idx"
+            ),
+        ),
+        migrations.RunPython(switch_search_to_items, switch_search_to_old_tables),
+        migrations.RunPython(copy_items, restore_items),
+        migrations.DeleteModel(
+            name="Error",
+        ),
+        migrations.DeleteModel(
+            name="Knowledge",
+        ),
+        migrations.DeleteModel(
+            name="Problem",
+        ),
+    ]
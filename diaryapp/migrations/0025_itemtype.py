@@ -0,0 +1,191 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:25
+
+from json import loads
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# QuestItem.kind -> раздел types.json
+KIND_SECTIONS = {"e": "errors", "p": "problems", "k": "knowledge"}
+# rowid в diaryapp_search = id * 8 + код вида (см. diaryapp.search)
+SEARCH_TRIGGERS = {
+    "diaryapp_task": ("1", "1"),
+    "diaryapp_questitem": (
+        "CASE NEW.kind WHEN 'e' THEN 2 WHEN 'p' THEN 3 WHEN 'k' THEN 4 END",
+        "CASE OLD.kind WHEN 'e' THEN 2 WHEN 'p' THEN 3 WHEN 'k' THEN 4 END",
+    ),
+}
+
+
+def seed_item_types(apps, schema_editor):
+    """
+    Справочник: всё из types.json и всё, что уже встречается в строках (включая удалённые из types.json типы).
+    """
+    ItemType = apps.get_model("diaryapp", "ItemType")
+    Task = apps.get_model("diaryapp", "Task")
+    QuestItem = apps.get_model("diaryapp", "QuestItem")
+    types = loads(settings.TYPES_PATH.read_bytes())
+    names = {
+        (section, name)
+        for section in ("tasks", *KIND_SECTIONS.values())
+        for name in types.get(section, ())
+    }
+    names |= {
+        ("tasks", name)
+        for name in Task.objects.values_list("type", flat=True).distinct()
+    }
+    names |= {
+        (KIND_SECTIONS[kind], name)
+        for kind, name in QuestItem.objects.exclude(type__isnull=True)
+        .exclude(type="")
+        .values_list("kind", "type")
+        .distinct()
+    }
+    ItemType.objects.bulk_create(
+        [ItemType(section=section, name=name) for section, name in sorted(names)]
+    )
+
+
+def fill_type_codes(apps, schema_editor):
+    """
+    Одно UPDATE на тип вместо обхода строк.
+    """
+    ItemType = apps.get_model("diaryapp", "ItemType")
+    Task = apps.get_model("diaryapp", "Task")
+    QuestItem = apps.get_model("diaryapp", "QuestItem")
+    kinds = {section: kind for kind, section in KIND_SECTIONS.items()}
+    for item_type in ItemType.objects.all():
+        if item_type.section == "tasks":
+            Task.objects.filter(type=item_type.name).update(type_code=item_type)
+        else:
+            QuestItem.objects.filter(
+                kind=kinds[item_type.section], type=item_type.name
+            ).update(type_code=item_type)
+
+
+def fill_type_names(apps, schema_editor):
+    ItemType = apps.get_model("diaryapp", "ItemType")
+    Task = apps.get_model("diaryapp", "Task")
+    QuestItem = apps.get_model("diaryapp", "QuestItem")
+    for item_type in ItemType.objects.all():
+        model = Task if item_type.section == "tasks" else QuestItem
+        model.objects.filter(type_code=item_type).update(type=item_type.name)
+
+
+def recreate_search_triggers(apps, schema_editor):
+    """
+    SQLite пересоздаёт таблицу при смене FK, а вместе со старой таблицей пропадают и её триггеры.
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table, (new_code, old_code) in SEARCH_TRIGGERS.items():
+        for action in ("insert", "update", "delete"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_search_{action}")
+        for statement in (
+            f"CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO diaryapp_search (rowid, text, quest_id, day) VALUES ("
+            f"NEW.id * 8 + {new_code}, NEW.text, NEW.quest_id, "
+            f"(SELECT created_date FROM diaryapp_quest WHERE id = NEW.quest_id)); END",
+            f"CREATE TRIGGER {table}_search_update AFTER UPDATE OF text ON {table} BEGIN "
+            f"UPDATE diaryapp_search SET text = NEW.text WHERE rowid = NEW.id * 8 + {new_code}; END",
+            f"CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM diaryapp_search WHERE rowid = OLD.id * 8 + {old_code}; END",
+        ):
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diaryapp", "0024_questitem"),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, recreate_search_triggers),
+        migrations.CreateModel(
+            name="ItemType",
+            fields=[
+                ("id", models.SmallAutoField(primary_key=True, serialize=False)),
+                ("section", models.CharField(max_length=20)),
+                ("name", models.CharField(max_length=50)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="itemtype",
+            constraint=models.UniqueConstraint(
+                fields=("section", "name"), name="diaryapp_itemtype_section_name"
+            ),
+        ),
+        migrations.RunPython(seed_item_types, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name="questitem",
+            name="type_code",
+            field=models.ForeignKey(
+                null=True,
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="diaryapp.itemtype",
+            ),
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="type_code",
+            field=models.ForeignKey(
+                null=True,
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="diaryapp.itemtype",
+            ),
+        ),
+        # при откате колонка возвращается пустой и заполняется fill_type_names до NOT NULL
+        migrations.AlterField(
+            model_name="task",
+            name="type",
+            field=models.CharField(max_length=50, null=True),
+        ),
+        migrations.RunPython(fill_type_codes, fill_type_names),
+        migrations.RemoveField(
+            model_name="questitem",
+            name="type",
+        ),
+        migrations.RemoveField(
+            model_name="task",
+            name="type",
+        ),
+        migrations.RenameField(
+            model_name="questitem",
+            old_name="type_code",
+            new_name="type",
+        ),
+        migrations.RenameField(
+            model_name="task",
+            old_name="type_code",
+            new_name="type",
+        ),
+        migrations.AlterField(
+            model_name="questitem",
+            name="type",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="diaryapp.itemtype",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="task",
+            name="type",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="diaryapp.itemtype",
+            ),
+        ),
+        migrations.RunPython(recreate_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,111 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:28
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 5000
+# rowid в diaryapp_search = id * 8 + код вида (см. diaryapp.search)
+SEARCH_CODES = {
+    "diaryapp_task": "1",
+    "diaryapp_questitem": "CASE NEW.kind WHEN 'e' THEN 2 WHEN 'p' THEN 3 WHEN 'k' THEN 4 END",
+}
+KIND_COUNTERS = {"e": "errors_total", "p": "problems_total", "k": "knowledge_total"}
+
+
+def insert_triggers_sql(day: str) -> list:
+    statements = []
+    for table, code in SEARCH_CODES.items():
+        statements += [
+            f"DROP TRIGGER IF EXISTS {table}_search_insert",
+            f"CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO diaryapp_search (rowid, text, quest_id, day) VALUES ("
+            f"NEW.id * 8 + {code}, NEW.text, NEW.quest_id, {day}); END",
+        ]
+    return statements
+
+
+def detach_search_from_quest(apps, schema_editor):
+    """
+    Триггеры вставки в индекс больше не читают diaryapp_quest (дату квеста search() берёт join'ом):
+    иначе SQLite не даёт пересоздать таблицу квестов, как этого требует AddField ниже.
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in insert_triggers_sql("NULL"):
+        schema_editor.execute(statement)
+
+
+def attach_search_to_quest(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    day = "(SELECT created_date FROM diaryapp_quest WHERE id = NEW.quest_id)"
+    for statement in insert_triggers_sql(day):
+        schema_editor.execute(statement)
+
+
+def backfill_counters(apps, schema_editor):
+    Quest = apps.get_model("diaryapp", "Quest")
+    Task = apps.get_model("diaryapp", "Task")
+    QuestItem = apps.get_model("diaryapp", "QuestItem")
+
+    def count(queryset):
+        return Coalesce(
+            Subquery(
+                queryset.filter(quest=OuterRef("pk"))
+                .order_by()
+                .values("quest")
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            0,
+        )
+
+    counters = {
+        "tasks_total": count(Task.objects.all()),
+        "tasks_done": count(Task.objects.filter(~Q(status=0))),
+    }
+    for kind, counter in KIND_COUNTERS.items():
+        counters[counter] = count(QuestItem.objects.filter(kind=kind))
+    max_id = Quest.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+    for start in range(0, max_id, BATCH_SIZE):
+        Quest.objects.filter(pk__gt=start, pk__lte=start + BATCH_SIZE).update(
+            **counters
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diaryapp", "0025_itemtype"),
+    ]
+
+    operations = [
+        migrations.RunPython(detach_search_from_quest, attach_search_to_quest),
+        migrations.AddField(
+            model_name="quest",
+            name="errors_total",
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="quest",
+            name="knowledge_total",
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="quest",
+            name="problems_total",
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="quest",
+            name="tasks_done",
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="quest",
+            name="tasks_total",
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
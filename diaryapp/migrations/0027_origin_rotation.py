@@ -0,0 +1,45 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:31
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_due_at(apps, schema_editor):
+    Origin = apps.get_model("diaryapp", "Origin")
+    # вес у всех существующих источников 1, поэтому due_at совпадает с last_extracted_at
+    Origin.objects.update(due_at=F("last_extracted_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diaryapp", "0026_quest_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="origin",
+            name="due_at",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="origin",
+            name="weight",
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.RunPython(backfill_due_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="origin",
+            index=models.Index(
+                fields=["status", "last_extracted_at", "created_at"],
+                name="diaryapp_or_status_fe082b_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="origin",
+            index=models.Index(
+                fields=["status", "due_at", "created_at"],
+                name="diaryapp_or_status_260d98_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.14 on 2026-10-18 17:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diaryapp", "0027_origin_rotation"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="quest",
+            name="origin",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="diaryapp.origin",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="quest",
+            index=models.Index(
+                fields=["origin", "created_at"], name="diaryapp_qu_origin__8a01f7_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# Индексы, нужные только PostgreSQL; на SQLite их роль играют diaryapp_search (FTS5, 0023)
+# и обычные индексы Origin (NULL и так меньше любого значения)
+INDEXES = (
+    # полнотекстовый поиск: выражения совпадают с diaryapp.search.ts_vector_sql
+    (
+        "diaryapp_task_text_search",
+        "diaryapp_task USING gin (to_tsvector('simple', text))",
+    ),
+    (
+        "diaryapp_questitem_text_search",
+        "diaryapp_questitem USING gin (to_tsvector('simple', text))",
+    ),
+    (
+        "diaryapp_day_content_search",
+        "diaryapp_day USING gin (to_tsvector('simple', content))",
+    ),
+    # Origin.next_for_quest сортирует NULL первыми, а btree PostgreSQL по умолчанию хранит их в конце
+    (
+        "diaryapp_origin_status_extracted_nulls_first",
+        "diaryapp_origin (status, last_extracted_at NULLS FIRST, created_at)",
+    ),
+    (
+        "diaryapp_origin_status_due_nulls_first",
+        "diaryapp_origin (status, due_at NULLS FIRST, created_at)",
+    ),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, definition in INDEXES:
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("diaryapp", "0028_quest_origin_created_at_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -1,42 +1,63 @@
-from json import load
-from pathlib import Path
+from operator import attrgetter
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
 
-from django.db.models import TextField
-from django.utils.timezone import now
+from django.db.models import F, TextField
+from django.utils.functional import cached_property
+from django.utils.timezone import now, localdate
 
-TYPES_PATH = Path("types.json").resolve()
-with open(TYPES_PATH) as file:
-    TYPES = load(file)
+from .types_registry import TypesRegistry
+
+TYPES = TypesRegistry(settings.TYPES_PATH, settings.TYPES_CHECK_INTERVAL)
 
 
 # def done_types_validator(value):
 # 	if value and value not in TYPES["done"]:
 # 		raise ValidationError("Wrong type")
 def task_types_validator(value):
-    if value and value not in TYPES["tasks"]:
+    if value and not TYPES.snapshot().contains("tasks", value):
         raise ValidationError("Wrong type")
 
 
 def error_types_validator(value):
-    if value and value not in TYPES["errors"]:
+    if value and not TYPES.snapshot().contains("errors", value):
         raise ValidationError("Wrong type")
 
 
 def problem_types_validator(value):
-    if value and value not in TYPES["problems"]:
+    if value and not TYPES.snapshot().contains("problems", value):
         raise ValidationError("Wrong type")
 
 
 def knowledge_types_validator(value):
-    if value and value not in TYPES["knowledge"]:
+    if value and not TYPES.snapshot().contains("knowledge", value):
         raise ValidationError("Wrong type")
 
 
+class ItemType(models.Model):
+    """
+    Справочник типов задач и элементов квестов, заполняемый из types.json.
+    Строки хранят маленький целочисленный id вместо строкового ключа; в API — по-прежнему ключ.
+    """
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=("section", "name"), name="diaryapp_itemtype_section_name"
+            ),
+        )
+
+    id = models.SmallAutoField(primary_key=True)
+    # раздел types.json: tasks, errors, problems, knowledge
+    section = models.CharField(max_length=20)
+    name = models.CharField(max_length=50)
+
+
 class Day(models.Model):
     created_at = models.DateTimeField()
+    created_date = models.DateField(default=localdate, db_index=True)
     content = models.TextField(null=True, blank=True)
 
 
@@ -46,37 +67,45 @@ class Day(models.Model):
 # 	quest = models.ForeignKey("Quest", on_delete=models.CASCADE, related_name="done")
 
 
-class Error(models.Model):
-    type = models.CharField(
-        max_length=50, validators=(error_types_validator,), null=True, blank=True
-    )
-    text = TextField(max_length=1000, null=True, blank=True)
-    quest = models.ForeignKey("Quest", on_delete=models.CASCADE, related_name="errors")
+class QuestItem(models.Model):
+    """
+    Ошибка, проблема или знание квеста: одна таблица с дискриминатором kind
+    вместо трёх одинаковых (type, text, quest).
+    """
 
+    # ключ коллекции в API -> код kind
+    KINDS = {"errors": "e", "problems": "p", "knowledge": "k"}
+    KIND_KEYS = {kind: key for key, kind in KINDS.items()}
 
-class Problem(models.Model):
-    type = models.CharField(
-        max_length=50, validators=(problem_types_validator,), null=True, blank=True
-    )
-    text = TextField(max_length=1000, null=True, blank=True)
-    quest = models.ForeignKey(
-        "Quest", on_delete=models.CASCADE, related_name="problems"
-    )
-
+    class Meta:
+        indexes = (models.Index(fields=("quest", "kind")),)
 
-class Knowledge(models.Model):
-    type = models.CharField(
-        max_length=50, validators=(knowledge_types_validator,), null=True, blank=True
+    kind = models.CharField(
+        max_length=1, choices=[(kind, key) for key, kind in KINDS.items()]
+    )
+    type = models.ForeignKey(
+        ItemType,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="+",
+        db_index=False,
     )
     text = TextField(max_length=1000, null=True, blank=True)
     quest = models.ForeignKey(
-        "Quest", on_delete=models.CASCADE, related_name="knowledge"
+        "Quest", on_delete=models.CASCADE, related_name="items", db_index=False
     )
 
+    @property
+    def key(self) -> str:
+        return self.KIND_KEYS[self.kind]
+
 
 class Task(models.Model):
     status = models.SmallIntegerField(default=0)
-    type = models.CharField(max_length=50, validators=(task_types_validator,))
+    type = models.ForeignKey(
+        ItemType, on_delete=models.PROTECT, related_name="+", db_index=False
+    )
     text = TextField(max_length=1000)
     quest = models.ForeignKey("Quest", on_delete=models.CASCADE, related_name="tasks")
 
@@ -84,14 +113,30 @@ class Task(models.Model):
 class Quest(models.Model):
     class Meta:
         ordering = "completed_at", "created_at"
+        indexes = (
+            models.Index(fields=("created_date", "created_at")),
+            models.Index(fields=("created_at", "id")),
+            # история источника: WHERE origin_id = ? ORDER BY created_at DESC, id DESC
+            models.Index(fields=("origin", "created_at")),
+        )
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=now)
+    created_date = models.DateField(default=localdate)
     completed_at = models.DateTimeField(null=True, blank=True)
     last_update = models.DateTimeField(null=True)
 
-    origin = models.ForeignKey("Origin", on_delete=models.SET_NULL, null=True)
+    origin = models.ForeignKey(
+        "Origin", on_delete=models.SET_NULL, null=True, db_index=False
+    )
     theme = models.CharField(max_length=100, null=True, blank=True)
 
+    # счётчики поддерживаются сериализаторами при записи; расхождения чинит manage.py recount
+    tasks_total = models.SmallIntegerField(default=0)
+    tasks_done = models.SmallIntegerField(default=0)
+    errors_total = models.SmallIntegerField(default=0)
+    problems_total = models.SmallIntegerField(default=0)
+    knowledge_total = models.SmallIntegerField(default=0)
+
     deprecated_total_tasks = models.SmallIntegerField(default=0)
     deprecated_total_completed_tasks = models.SmallIntegerField(default=0)
     deprecated_complete_description = models.TextField(
@@ -99,6 +144,32 @@ class Quest(models.Model):
     )
     deprecated_knowledge = models.TextField(max_length=1000, null=True, blank=True)
 
+    @cached_property
+    def items_by_kind(self) -> dict:
+        """
+        Ошибки, проблемы и знания квеста по ключам коллекций — одним запросом
+        (или из prefetch_related("items")). Запоминается на экземпляре до forget_items().
+        """
+        grouped = {key: [] for key in QuestItem.KINDS}
+        for item in sorted(self.items.all(), key=attrgetter("pk")):
+            grouped[item.key].append(item)
+        return grouped
+
+    @staticmethod
+    def counter(key: str) -> str:
+        """
+        param:
+        key (str): ключ коллекции элементов (errors, problems, knowledge).
+
+        return:
+        str: имя поля-счётчика.
+        """
+        return f"{key}_total"
+
+    def forget_items(self):
+        self.__dict__.pop("items_by_kind", None)
+        getattr(self, "_prefetched_objects_cache", {}).pop("items", None)
+
 
 class Origin(models.Model):
     class Meta:
@@ -106,6 +177,10 @@ class Origin(models.Model):
             "last_extracted_at",
             "created_at",
         )
+        indexes = (
+            models.Index(fields=("status", "last_extracted_at", "created_at")),
+            models.Index(fields=("status", "due_at", "created_at")),
+        )
 
     STATUS_CHOICES = [
         ("a", "actual"),
@@ -119,3 +194,60 @@ class Origin(models.Model):
         max_length=1, default="a", null=False, choices=STATUS_CHOICES
     )
     origin = models.CharField(max_length=2048, null=True, blank=True)
+    # для ORIGIN_ROTATION = "weighted": доля квестов источника пропорциональна весу
+    weight = models.PositiveSmallIntegerField(default=1)
+    due_at = models.DateTimeField(null=True, editable=False)
+
+    def mark_extracted(self):
+        """
+        Отмечает извлечение источника для квеста (сохранение — на вызывающем).
+
+        due_at сдвигается на ORIGIN_ROTATION_PERIOD / weight от прежнего значения (stride scheduling),
+        поэтому доли извлечений пропорциональны весам независимо от частоты создания квестов.
+        Отставание от текущего времени ограничено одним периодом, чтобы долго не выбиравшийся
+        источник не забирал потом все квесты подряд.
+        """
+        self.last_extracted_at = now()
+        period = settings.ORIGIN_ROTATION_PERIOD
+        floor = self.last_extracted_at - period
+        self.due_at = max(self.due_at or floor, floor) + period / max(self.weight, 1)
+
+    @classmethod
+    def next_for_quest(cls):
+        """
+        Источник для нового квеста одним запросом по составному индексу.
+
+        Приоритет: актуальные раньше замороженных (status "a" < "f"), внутри статуса — ни разу
+        не извлечённые (NULL первыми) по дате создания, затем давно извлечённые.
+        В режиме ORIGIN_ROTATION = "weighted" вместо last_extracted_at используется due_at
+        (см. mark_extracted).
+
+        return:
+        Origin | None
+        """
+        key = (
+            "due_at" if settings.ORIGIN_ROTATION == "weighted" else "last_extracted_at"
+        )
+        return cls.objects.order_by(
+            "status", F(key).asc(nulls_first=True), "created_at"
+        ).first()
+
+
+class DayStats(models.Model):
+    """
+    Дневная сводка, поддерживаемая инкрементально (см. statistics.DayStatsDelta).
+    Всё относится к дню создания квеста (Quest.created_date).
+    """
+
+    date = models.DateField(unique=True)
+    quests_created = models.IntegerField(default=0)
+    quests_completed = models.IntegerField(default=0)
+    tasks_total = models.IntegerField(default=0)
+    tasks_done = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    problems = models.IntegerField(default=0)
+    knowledge = models.IntegerField(default=0)
+    # {task_type: {status: count}}
+    task_types = models.JSONField(default=dict)
+    # {error_type: count}
+    error_types = models.JSONField(default=dict)
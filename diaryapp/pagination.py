@@ -0,0 +1,77 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from datetime import datetime
+from json import dumps, loads
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def query_params(request):
+    return getattr(request, "query_params", request.GET)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация квестов от новых к старым по (created_at, id).
+
+    Курсор хранит ключ последнего элемента страницы, следующая страница — это
+    WHERE (created_at, id) < курсор, поэтому стоимость страницы не зависит от глубины (без OFFSET).
+    Принимает и Request DRF, и обычный HttpRequest (HTML-страницы).
+    """
+
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    ordering = "-created_at", "-pk"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            created_at, pk = cursor
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            )
+        page = list(queryset.order_by(*self.ordering)[: page_size + 1])
+        self.next_cursor = (
+            self.encode_cursor(page[page_size - 1]) if len(page) > page_size else None
+        )
+        return page[:page_size]
+
+    def get_paginated_response(self, data):
+        return Response(data={"next": self.get_next_link(), "results": data})
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor
+        )
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(query_params(request).get(self.page_size_query_param, ""))
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    @staticmethod
+    def encode_cursor(instance) -> str:
+        position = dumps([instance.created_at.isoformat(), instance.pk])
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        cursor = query_params(request).get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            created_at, pk = loads(urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(created_at), int(pk)
+        except (DecodeError, ValueError, TypeError):
+            raise ValidationError({self.cursor_query_param: "Invalid cursor"})
@@ -0,0 +1,125 @@
+from functools import partial, wraps
+from logging import getLogger
+from random import uniform
+from threading import Lock
+from time import sleep
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+logger = getLogger("stdout")
+
+
+# PostgreSQL: serialization_failure, deadlock_detected, lock_not_available
+RETRY_SQLSTATES = "40001", "40P01", "55P03"
+
+
+def is_lock_error(exc: Exception) -> bool:
+    """
+    «database is locked» / «database table is locked» и подобные на SQLite, конфликт блокировок
+    или сериализации на PostgreSQL: транзакцию можно повторить.
+    """
+    if not isinstance(exc, OperationalError):
+        return False
+    if getattr(exc.__cause__, "sqlstate", None) in RETRY_SQLSTATES:
+        return True
+    message = str(exc).lower()
+    return "locked" in message or "busy" in message
+
+
+class WriteRetry:
+    """
+    Повтор пишущей транзакции, упавшей на блокировке базы, с экспоненциальной задержкой и джиттером:
+    перед повтором n (с 1) ждём случайное время от 0 до min(WRITE_RETRY_MAX_DELAY,
+    WRITE_RETRY_BASE_DELAY * 2**(n - 1)), всего не больше WRITE_RETRY_ATTEMPTS попыток.
+
+    Повторяется функция целиком, поэтому транзакцию (atomic) открывает она сама. Состояние в памяти,
+    испорченное неудачной попыткой, восстанавливает reset(*args, **kwargs) перед повтором.
+    Внутри чужой транзакции повторять нечего (она уже откатится), ошибка пробрасывается сразу.
+    Счётчики считаются в пределах процесса.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.retried_calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait = 0.0
+        self.max_wait = 0.0
+        self._lock = Lock()
+
+    def __call__(self, func=None, *, reset=None):
+        """
+        Декоратор: @write_retry или @write_retry(reset=...).
+        """
+        if func is None:
+            return partial(self, reset=reset)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(func, args, kwargs, reset)
+
+        return wrapper
+
+    def run(self, func, args=(), kwargs=None, reset=None):
+        kwargs = kwargs or {}
+        if connection.in_atomic_block:
+            return func(*args, **kwargs)
+        retries = 0
+        waited = 0.0
+        try:
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as exc:
+                    if not is_lock_error(exc):
+                        raise
+                    if retries + 1 >= settings.WRITE_RETRY_ATTEMPTS:
+                        self._count(failures=1)
+                        logger.warning(
+                            f"{func.__qualname__}: gave up after {retries + 1} attempts, "
+                            f"waited {waited:.3f}s: {exc}"
+                        )
+                        raise
+                retries += 1
+                delay = uniform(
+                    0,
+                    min(
+                        settings.WRITE_RETRY_MAX_DELAY,
+                        settings.WRITE_RETRY_BASE_DELAY * 2 ** (retries - 1),
+                    ),
+                )
+                sleep(delay)
+                waited += delay
+                if reset is not None:
+                    reset(*args, **kwargs)
+        finally:
+            self._count(calls=1, retries=retries, wait=waited)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retried_calls": self.retried_calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "wait_s": self.wait,
+                "max_wait_s": self.max_wait,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = self.retried_calls = self.retries = self.failures = 0
+            self.wait = self.max_wait = 0.0
+
+    def _count(self, calls=0, retries=0, failures=0, wait=0.0):
+        with self._lock:
+            self.calls += calls
+            self.retried_calls += bool(retries)
+            self.retries += retries
+            self.failures += failures
+            self.wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+
+write_retry = WriteRetry()
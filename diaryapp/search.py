@@ -0,0 +1,169 @@
+from re import findall
+
+from django.db import connection
+from django.db.transaction import atomic
+
+SEARCH_TABLE = "diaryapp_search"
+
+# rowid записи индекса: id исходной строки * ROWID_FACTOR + код вида
+ROWID_FACTOR = 8
+KINDS = {1: "task", 2: "error", 3: "problem", 4: "knowledge", 5: "day"}
+# код вида элемента квеста по QuestItem.kind
+ITEM_CODES = {"e": 2, "p": 3, "k": 4}
+SOURCES = {
+    "task": "diaryapp_task",
+    "item": "diaryapp_questitem",
+    "day": "diaryapp_day",
+}
+# На PostgreSQL отдельного индекса нет: ищется по to_tsvector(TS_CONFIG, <колонка>)
+# с GIN-индексами по тем же выражениям (миграция 0029), их поддерживает сама база
+TS_CONFIG = "simple"
+TEXT_COLUMNS = {"task": "text", "item": "text", "day": "content"}
+
+
+def item_code_sql(column: str) -> str:
+    """
+    SQL-выражение кода вида для QuestItem.kind (используется и триггерами, см. миграции).
+    """
+    cases = " ".join(f"WHEN '{kind}' THEN {code}" for kind, code in ITEM_CODES.items())
+    return f"CASE {column} {cases} END"
+
+
+def build_match_query(query: str) -> str:
+    """
+    Превращает пользовательский ввод в выражение FTS5: все слова обязательны,
+    последнее ищется по префиксу. Спецсимволы FTS5 отбрасываются.
+    """
+    tokens = findall(r"\w+", query)
+    if not tokens:
+        return ""
+    return " ".join(f'"{token}"' for token in tokens) + "*"
+
+
+def ts_vector_sql(column: str) -> str:
+    """
+    Выражение, по которому построены GIN-индексы на PostgreSQL (используется и миграцией 0029).
+    """
+    return f"to_tsvector('{TS_CONFIG}', {column})"
+
+
+def build_ts_query(query: str) -> str:
+    """
+    То же, что build_match_query, для to_tsquery PostgreSQL: все слова обязательны, последнее — префикс.
+    """
+    tokens = findall(r"\w+", query)
+    if not tokens:
+        return ""
+    return " & ".join(tokens[:-1] + [f"{tokens[-1]}:*"])
+
+
+def _sqlite_search_sql() -> str:
+    return (
+        f"SELECT {SEARCH_TABLE}.rowid, quest_id, COALESCE(day, quest.created_date), "
+        f"snippet({SEARCH_TABLE}, 0, '[', ']', '…', 16), bm25({SEARCH_TABLE}) "
+        f"FROM {SEARCH_TABLE} LEFT JOIN diaryapp_quest quest ON quest.id = quest_id "
+        f"WHERE {SEARCH_TABLE} MATCH %s ORDER BY rank LIMIT %s"
+    )
+
+
+def _postgresql_search_sql() -> str:
+    """
+    Лучшие совпадения по трём таблицам, сниппеты (ts_headline) — только для них.
+    Ранг возвращается со знаком минус, чтобы, как у bm25, меньшее значение было релевантнее.
+    """
+    hits = []
+    for source, table in SOURCES.items():
+        vector = ts_vector_sql(TEXT_COLUMNS[source])
+        if source == "day":
+            rowid, quest_id, day = f"id * {ROWID_FACTOR} + 5", "NULL", "created_date"
+        else:
+            code = "1" if source == "task" else item_code_sql("kind")
+            rowid, quest_id, day = f"id * {ROWID_FACTOR} + {code}", "quest_id", "NULL"
+        hits.append(
+            f"SELECT {rowid} AS rowid, {quest_id} AS quest_id, {day}::date AS day, "
+            f"{TEXT_COLUMNS[source]} AS text, ts_rank({vector}, q) AS rank "
+            f"FROM {table}, query WHERE {vector} @@ q"
+        )
+    return (
+        f"WITH query AS (SELECT to_tsquery('{TS_CONFIG}', %s) AS q), "
+        f"hits AS ({' UNION ALL '.join(hits)} ORDER BY rank DESC LIMIT %s) "
+        f"SELECT rowid, quest_id, COALESCE(day, quest.created_date), "
+        f"ts_headline('{TS_CONFIG}', text, q, "
+        f"'StartSel=[, StopSel=], MaxWords=16, MinWords=8'), -rank "
+        f"FROM hits CROSS JOIN query LEFT JOIN diaryapp_quest quest ON quest.id = quest_id "
+        f"ORDER BY rank DESC"
+    )
+
+
+def search(query: str, limit: int = 20) -> list:
+    """
+    Ищет по задачам, ошибкам, проблемам, знаниям и заметкам дней
+    (FTS5 на SQLite, to_tsvector/to_tsquery на PostgreSQL).
+
+    return:
+    List[dict]: результаты по убыванию релевантности со сниппетом,
+        id квеста (для заметок — None) и датой дня; rank — чем меньше, тем релевантнее.
+    """
+    if connection.vendor == "postgresql":
+        sql, match = _postgresql_search_sql(), build_ts_query(query)
+    else:
+        sql, match = _sqlite_search_sql(), build_match_query(query)
+    if not match:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, limit])
+        rows = cursor.fetchall()
+    return [
+        {
+            "kind": KINDS[rowid % ROWID_FACTOR],
+            "id": rowid // ROWID_FACTOR,
+            "quest": quest_id,
+            "date": day,
+            "snippet": snippet,
+            "rank": rank,
+        }
+        for rowid, quest_id, day, snippet, rank in rows
+    ]
+
+
+def _source_select(source: str) -> str:
+    table = SOURCES[source]
+    if source == "day":
+        return (
+            f"SELECT id * {ROWID_FACTOR} + 5, content, NULL, created_date "
+            f"FROM {table} WHERE id > %s AND id <= %s"
+        )
+    code = "1" if source == "task" else item_code_sql("kind")
+    return (
+        f"SELECT id * {ROWID_FACTOR} + {code}, text, quest_id, NULL "
+        f"FROM {table} WHERE id > %s AND id <= %s"
+    )
+
+
+def rebuild_search_index(batch_size: int = 5000, log=None):
+    """
+    Перестраивает индекс с нуля, по batch_size строк исходной таблицы на транзакцию.
+    Одновременные записи не теряются: триггеры продолжают работать, а пакеты вставляются через INSERT OR REPLACE.
+    На PostgreSQL перестраивать нечего: GIN-индексы обновляет сама база.
+    """
+    if connection.vendor == "postgresql":
+        if log:
+            log("postgresql: search uses GIN indexes maintained by the database")
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        for source, table in SOURCES.items():
+            cursor.execute(f"SELECT MAX(id) FROM {table}")
+            max_id = cursor.fetchone()[0] or 0
+            for start in range(0, max_id, batch_size):
+                with atomic():
+                    cursor.execute(
+                        f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, text, quest_id, day) "
+                        + _source_select(source),
+                        [start, start + batch_size],
+                    )
+            if log:
+                log(f"{source}: indexed up to id {max_id}")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"
+        )
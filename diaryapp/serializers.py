@@ -2,40 +2,248 @@ from logging import getLogger
 
 from django.db.transaction import atomic
 from django.utils.timezone import now
-from rest_framework.fields import IntegerField
-from rest_framework.serializers import ModelSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import (
+    IntegerField,
+    ChoiceField,
+    CharField,
+    JSONField,
+    empty,
+)
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.serializers import ModelSerializer, Serializer, ListSerializer
 
-from .models import Quest, Error, Problem, Knowledge, Task, TYPES, Origin
+from .analytics import bump_data_version
+from .cache import quest_cache
+from .models import (
+    Quest,
+    QuestItem,
+    Task,
+    TYPES,
+    Origin,
+    DayStats,
+)
+from .item_types import item_types
+from .retry import write_retry
+from .statistics import DayStatsDelta
 
 logger = getLogger("stdout")
 
 
-class ErrorModelSerializer(ModelSerializer):
-    class Meta:
-        model = Error
-        fields = "text", "type"
+def _reload_origins(items: list):
+    """
+    reset для write_retry: due_at источников уже сдвинут неудачной попыткой.
+    """
+    for origin in {data["origin"].pk: data["origin"] for data in items}.values():
+        origin.refresh_from_db(fields=("last_extracted_at", "due_at"))
 
 
-class ProblemModelSerializer(ModelSerializer):
-    class Meta:
-        model = Problem
-        fields = "text", "type"
+def _reload_quest(serializer, instance, validated_data):
+    """
+    reset для write_retry: счётчики, статусы задач и элементы квеста изменены неудачной попыткой.
+    """
+    instance.refresh_from_db()
+    instance.forget_items()
+
+
+def _lock_quest(instance):
+    """
+    Перечитывает квест под блокировкой строки (вызывается внутри транзакции): счётчики, completed_at
+    и элементы берутся актуальными, параллельная запись того же квеста ждёт коммита.
+    Без этого изменения ±1 от загруженного до транзакции экземпляра теряют чужие обновления.
+    """
+    instance.refresh_from_db(from_queryset=Quest.objects.select_for_update())
+    instance.forget_items()
+
+
+class DynamicFieldsModelSerializer(ModelSerializer):
+    """
+    Принимает необязательный аргумент fields — подмножество полей Meta.fields.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class QuestShape:
+    """
+    Форма ответа квеста из параметров запроса:
+        include=types,errors,problems,knowledge — необязательные части (без параметра — все);
+        fields[tasks]=id,status — подмножество полей элементов коллекции (аналогично для errors и т.д.).
+    Невключённые коллекции не запрашиваются из базы.
+    """
+
+    optional = "types", "errors", "problems", "knowledge"
+    collection_fields = {
+        "tasks": ("id", "text", "type", "status"),
+        "errors": ("id", "text", "type"),
+        "problems": ("id", "text", "type"),
+        "knowledge": ("id", "text", "type"),
+    }
+
+    def __init__(self, include=None, fields=None):
+        self.include = frozenset(self.optional if include is None else include)
+        self.fields = fields or {}
+
+    @classmethod
+    def from_query_params(cls, params):
+        include = None
+        if "include" in params:
+            include = {name for name in params["include"].split(",") if name}
+            if include - set(cls.optional):
+                raise ValidationError(
+                    {"include": f"Allowed: {', '.join(cls.optional)}"}
+                )
+        fields = {}
+        for key, allowed in cls.collection_fields.items():
+            param = f"fields[{key}]"
+            if param in params:
+                names = {name for name in params[param].split(",") if name}
+                if not names or names - set(allowed):
+                    raise ValidationError({param: f"Allowed: {', '.join(allowed)}"})
+                fields[key] = frozenset(names)
+        return cls(include, fields)
+
+    @property
+    def is_full(self) -> bool:
+        return self.include == frozenset(self.optional) and not self.fields
+
+    def key(self) -> str:
+        """
+        Каноническая запись формы (для ETag).
+        """
+        return ";".join(
+            [",".join(sorted(self.include))]
+            + [
+                f"{key}:{','.join(sorted(names))}"
+                for key, names in sorted(self.fields.items())
+            ]
+        )
+
+    def without_fields(self):
+        return QuestShape(self.include)
+
+    def includes(self, key: str) -> bool:
+        return key not in self.optional or key in self.include
+
+    def slice(self, data: dict) -> dict:
+        """
+        Вырезает форму из полного представления (например, из кэша).
+        """
+        result = {}
+        for key, value in data.items():
+            if not self.includes(key):
+                continue
+            if key in self.fields:
+                value = [
+                    {name: item[name] for name in item if name in self.fields[key]}
+                    for item in value
+                ]
+            result[key] = value
+        return result
+
+
+class ItemTypeField(CharField):
+    """
+    Тип задачи или элемента квеста: в API — ключ из types.json, в модели — id строки ItemType
+    (объявляется с source="type_id").
+    """
+
+    def __init__(self, section: str, **kwargs):
+        self.section = section
+        kwargs.setdefault("max_length", 50)
+        super().__init__(**kwargs)
 
+    def run_validation(self, data=empty):
+        name = super().run_validation(data)
+        if name and not TYPES.snapshot().contains(self.section, name):
+            raise ValidationError("Wrong type")
+        return item_types.id(self.section, name)
+
+    def to_representation(self, value):
+        return item_types.name(value)
+
+
+class OriginField(PrimaryKeyRelatedField):
+    """
+    Источник квеста. Если источники заранее загружены в context["origins"] (пакетное создание),
+    берёт их оттуда, а не запросом на каждый квест.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("queryset", Origin.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        origins = self.context.get("origins")
+        if origins is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return origins[int(data)]
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+
+
+class QuestItemListSerializer(ListSerializer):
+    """
+    Коллекция элементов квеста одного вида. Читает из Quest.items_by_kind,
+    поэтому все три коллекции квеста загружаются одним запросом.
+    """
+
+    def get_attribute(self, instance):
+        return instance.items_by_kind[self.child.key]
+
+
+class QuestItemModelSerializer(DynamicFieldsModelSerializer):
+    key = None
+    type_options = {
+        "source": "type_id",
+        "allow_null": True,
+        "allow_blank": True,
+        "required": False,
+    }
+    id = IntegerField(required=False, allow_null=True)
 
-class KnowledgeModelSerializer(ModelSerializer):
     class Meta:
-        model = Knowledge
-        fields = "text", "type"
+        model = QuestItem
+        fields = "id", "text", "type"
+        list_serializer_class = QuestItemListSerializer
+
+
+class ErrorModelSerializer(QuestItemModelSerializer):
+    key = "errors"
+    type = ItemTypeField("errors", **QuestItemModelSerializer.type_options)
+
+
+class ProblemModelSerializer(QuestItemModelSerializer):
+    key = "problems"
+    type = ItemTypeField("problems", **QuestItemModelSerializer.type_options)
+
+
+class KnowledgeModelSerializer(QuestItemModelSerializer):
+    key = "knowledge"
+    type = ItemTypeField("knowledge", **QuestItemModelSerializer.type_options)
 
 
 class TaskCreateModelSerializer(ModelSerializer):
+    type = ItemTypeField("tasks", source="type_id")
+
     class Meta:
         model = Task
         fields = "text", "type", "status"
 
 
-class TaskUpdateModelSerializer(ModelSerializer):
+class TaskUpdateModelSerializer(DynamicFieldsModelSerializer):
     id = IntegerField(read_only=False)
+    type = ItemTypeField("tasks", source="type_id")
 
     class Meta:
         model = Task
@@ -44,6 +252,7 @@ class TaskUpdateModelSerializer(ModelSerializer):
 
 class QuestCreateModelSerializer(ModelSerializer):
     tasks = TaskCreateModelSerializer(many=True)
+    origin = OriginField()
 
     class Meta:
         model = Quest
@@ -53,28 +262,63 @@ class QuestCreateModelSerializer(ModelSerializer):
         logger.debug(
             f"Class: {self.__class__.__name__}\nMethod: {self.create.__name__}\nvalidation data: {validated_data}"
         )
+        return self.create_batch([validated_data])[0]
+
+    @staticmethod
+    @write_retry(reset=_reload_origins)
+    def create_batch(items: list) -> list:
+        """
+        Создаёт квесты одной транзакцией: по одному bulk_create на квесты и на задачи,
+        одно обновление источников (каждый пишется один раз, сколько бы квестов из него ни было)
+        и одно применение дельты статистики — независимо от числа квестов.
+
+        param:
+        items (List[dict]): validated_data квестов.
+
+        return:
+        List[Quest]: созданные квесты в порядке items.
+        """
+        quests, tasks = [], []
+        for data in items:
+            quest_tasks = [Task(**task) for task in data["tasks"]]
+            quests.append(
+                Quest(
+                    theme=data.get("theme"),
+                    origin=data["origin"],
+                    tasks_total=len(quest_tasks),
+                    tasks_done=sum(1 for task in quest_tasks if task.status),
+                )
+            )
+            tasks.append(quest_tasks)
+        origins = {data["origin"].pk: data["origin"] for data in items}
+
         with atomic():
-            quest = Quest.objects.create(
-                theme=validated_data["theme"], origin=validated_data["origin"]
+            Quest.objects.bulk_create(quests)
+            for quest, quest_tasks in zip(quests, tasks):
+                for task in quest_tasks:
+                    task.quest = quest
+            Task.objects.bulk_create(
+                task for quest_tasks in tasks for task in quest_tasks
+            )
+            # due_at сдвигается на каждый квест, а в базу источник пишется один раз
+            for data in items:
+                origins[data["origin"].pk].mark_extracted()
+            Origin.objects.bulk_update(
+                origins.values(), ("last_extracted_at", "due_at")
             )
-            data_to_create = []
-            for data in validated_data["tasks"]:
-                data["quest_id"] = quest.pk
-                data_to_create.append(Task(**data))
-            Task.objects.bulk_create(data_to_create)
-            validated_data["origin"].last_extracted_at = now()
-            validated_data["origin"].save()
 
+            delta = DayStatsDelta()
+            for quest, quest_tasks in zip(quests, tasks):
+                delta.add_quest(quest.created_date)
+                for task in quest_tasks:
+                    delta.add_task(quest.created_date, task.type_id, task.status)
+            delta.apply()
+            bump_data_version()
 
-            return quest
+        return quests
 
 
 class QuestEditModelSerializer(ModelSerializer):
-    item_map = (
-        (Error, "errors"),
-        (Problem, "problems"),
-        (Knowledge, "knowledge"),
-    )
     tasks = TaskUpdateModelSerializer(many=True)
     errors = ErrorModelSerializer(many=True)
     problems = ProblemModelSerializer(many=True)
@@ -84,30 +328,303 @@ class QuestEditModelSerializer(ModelSerializer):
         model = Quest
         fields = "tasks", "errors", "problems", "knowledge"
 
+    def get_fields(self):
+        fields = super().get_fields()
+        shape = self.context.get("shape")
+        if shape is not None:
+            for key in list(fields):
+                if not shape.includes(key):
+                    del fields[key]
+            for key, names in shape.fields.items():
+                if key in fields:
+                    fields[key] = fields[key].child.__class__(many=True, fields=names)
+        return fields
+
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        data["types"] = TYPES
+        shape = self.context.get("shape")
+        if shape is None or shape.includes("types"):
+            data["types"] = self.context.get("types", TYPES.snapshot()).data
         return data
 
+    @write_retry(reset=_reload_quest)
     def update(self, instance, validated_data):
         logger.debug(
             f"Class: {self.__class__.__name__}\nMethod: {self.update.__name__}\nInstance: {instance.__class__.__name__}\nvalidation data: {validated_data}"
         )
         with atomic():
-            for item_class, key in self.item_map:
-                item_class.objects.filter(quest=instance).delete()
-                data_to_create = []
-                for data in validated_data[key]:
-                    data["quest"] = instance
-                    data_to_create.append(item_class(**data))
-                item_class.objects.bulk_create(data_to_create)
-            done = True
-            for task in validated_data["tasks"]:
-                if not task["status"]:
-                    done = False
-                Task.objects.filter(pk=task["id"]).update(status=task["status"])
-            instance.last_update = now()
-            if not instance.completed_at and done:
-                instance.completed_at = now()
-            instance.save()
+            _lock_quest(instance)
+            changes = self._diff_items(instance, validated_data)
+            statuses = {task["id"]: task["status"] for task in validated_data["tasks"]}
+            self.apply_changes(instance, changes, statuses)
+        return instance
+
+    @staticmethod
+    def _diff_items(instance, validated_data):
+        """
+        Сравнивает переданные коллекции элементов квеста с сохранёнными (один запрос на все коллекции).
+        Коллекции, которых нет в validated_data, не трогаются.
+
+        Элементы без id (или с чужим id) считаются новыми, отсутствующие в списке — удалёнными.
+
+        return:
+        Tuple[List[QuestItem], List[QuestItem], List[int]]: элементы для создания, изменённые элементы и id для удаления.
+        """
+        to_create = []
+        to_update = []
+        to_delete = []
+        for key, kind in QuestItem.KINDS.items():
+            if key not in validated_data:
+                continue
+            stored = {item.pk: item for item in instance.items_by_kind[key]}
+            for data in validated_data[key]:
+                item = stored.pop(data.get("id"), None)
+                text, type_id = data.get("text"), data.get("type_id")
+                if item is None:
+                    to_create.append(
+                        QuestItem(quest=instance, kind=kind, text=text, type_id=type_id)
+                    )
+                elif (item.text, item.type_id) != (text, type_id):
+                    item.text, item.type_id = text, type_id
+                    to_update.append(item)
+            to_delete.extend(stored)
+        return to_create, to_update, to_delete
+
+    @staticmethod
+    def apply_changes(instance, changes, statuses):
+        """
+        Записывает изменения квеста: по одному delete/bulk_create/bulk_update на все элементы
+        и один bulk_update статусов задач. Квест (вместе со счётчиками) сохраняется, только если что-то изменилось.
+        Вызывается внутри транзакции.
+
+        param:
+        changes (Tuple[List[QuestItem], List[QuestItem], List[int]]): см. _diff_items.
+        statuses (Dict[int, int]): новые статусы задач по id.
+        """
+        to_create, to_update, to_delete = changes
+        changed = bool(to_create or to_update or to_delete)
+        date = instance.created_date
+        delta = DayStatsDelta()
+        if to_delete or to_update:
+            to_delete = set(to_delete)
+            for pk, kind, type_ in QuestItem.objects.filter(
+                quest=instance,
+                pk__in=[*to_delete, *(item.pk for item in to_update)],
+            ).values_list("pk", "kind", "type"):
+                key = QuestItem.KIND_KEYS[kind]
+                delta.add_item(date, key, type_, -1)
+                if pk in to_delete:
+                    counter = Quest.counter(key)
+                    setattr(instance, counter, getattr(instance, counter) - 1)
+        if to_delete:
+            QuestItem.objects.filter(quest=instance, pk__in=to_delete).delete()
+        if to_create:
+            QuestItem.objects.bulk_create(to_create)
+            for item in to_create:
+                counter = Quest.counter(item.key)
+                setattr(instance, counter, getattr(instance, counter) + 1)
+        if to_update:
+            QuestItem.objects.bulk_update(to_update, ("text", "type"))
+        for item in (*to_create, *to_update):
+            delta.add_item(date, item.key, item.type_id)
+        if changed:
+            instance.forget_items()
+
+        tasks = list(instance.tasks.all())
+        to_update = []
+        for task in tasks:
+            status = statuses.get(task.pk, task.status)
+            if status != task.status:
+                delta.add_task(date, task.type_id, task.status, -1)
+                delta.add_task(date, task.type_id, status)
+                task.status = status
+                to_update.append(task)
+        if to_update:
+            Task.objects.bulk_update(to_update, ("status",))
+            changed = True
+
+        timestamp = now()
+        if not instance.completed_at and all(task.status for task in tasks):
+            instance.completed_at = timestamp
+            delta.complete_quest(date)
+            changed = True
+        delta.apply()
+        if changed:
+            instance.last_update = timestamp
+            instance.tasks_total = len(tasks)
+            instance.tasks_done = sum(1 for task in tasks if task.status)
+            instance.save(
+                update_fields=(
+                    "last_update",
+                    "completed_at",
+                    "tasks_total",
+                    "tasks_done",
+                    *(Quest.counter(key) for key in QuestItem.KINDS),
+                )
+            )
+            quest_cache.invalidate(instance.pk)
+            bump_data_version()
+
+
+class QuestPatchSerializer(ListSerializer):
+    @write_retry(reset=_reload_quest)
+    def update(self, instance, validated_data):
+        logger.debug(
+            f"Class: {self.__class__.__name__}\nMethod: {self.update.__name__}\nInstance: {instance.__class__.__name__}\nvalidation data: {validated_data}"
+        )
+        with atomic():
+            _lock_quest(instance)
+            to_create = []
+            replaced = {}
+            removed = {}
+            statuses = {}
+            for operation in validated_data:
+                key, pk = operation["key"], operation["id"]
+                if key == "tasks":
+                    statuses[pk] = operation["value"]
+                elif operation["op"] == "add":
+                    to_create.append(
+                        QuestItem(
+                            quest=instance,
+                            kind=QuestItem.KINDS[key],
+                            **operation["value"],
+                        )
+                    )
+                elif operation["op"] == "remove":
+                    removed[pk] = key
+                    replaced.pop(pk, None)
+                else:
+                    fields = replaced.setdefault(pk, (key, {}))[1]
+                    fields[operation["field"]] = operation["value"]
+
+            stored = QuestItem.objects.filter(
+                quest=instance, pk__in=[*replaced, *removed]
+            ).in_bulk()
+            to_update = []
+            for pk, (key, fields) in replaced.items():
+                item = stored.get(pk)
+                if item is None or item.key != key:
+                    raise ValidationError({key: "Unknown item id"})
+                for field, value in fields.items():
+                    setattr(item, field, value)
+                to_update.append(item)
+            to_delete = []
+            for pk, key in removed.items():
+                item = stored.get(pk)
+                if item is None or item.key != key:
+                    raise ValidationError({key: "Unknown item id"})
+                to_delete.append(pk)
+
+            if not set(statuses) <= set(
+                instance.tasks.filter(pk__in=statuses).values_list("pk", flat=True)
+            ):
+                raise ValidationError({"tasks": "Unknown task id"})
+            QuestEditModelSerializer.apply_changes(
+                instance, (to_create, to_update, to_delete), statuses
+            )
         return instance
+
+
+class QuestPatchOperationSerializer(Serializer):
+    """
+    Операция частичного изменения квеста в стиле JSON Patch:
+        {"op": "add", "path": "/errors/-", "value": {"type": ..., "text": ...}}
+        {"op": "remove", "path": "/errors/<id>"}
+        {"op": "replace", "path": "/errors/<id>/text", "value": ...}
+        {"op": "replace", "path": "/tasks/<id>/status", "value": 1}
+    """
+
+    item_serializers = {
+        "errors": ErrorModelSerializer,
+        "problems": ProblemModelSerializer,
+        "knowledge": KnowledgeModelSerializer,
+    }
+    op = ChoiceField(choices=("add", "remove", "replace"))
+    path = CharField()
+    # null — например, снятый тип элемента
+    value = JSONField(required=False, allow_null=True)
+
+    class Meta:
+        list_serializer_class = QuestPatchSerializer
+
+    def validate(self, attrs):
+        op, value = attrs["op"], attrs.get("value")
+        if op != "remove" and "value" not in attrs:
+            raise ValidationError({"value": "This field is required."})
+        key, *rest = attrs["path"].strip("/").split("/")
+        pk = field = None
+        if (
+            key == "tasks"
+            and op == "replace"
+            and len(rest) == 2
+            and rest[1] == "status"
+        ):
+            pk, field = rest
+            value = TaskUpdateModelSerializer().fields["status"].run_validation(value)
+        elif key in self.item_serializers and op == "add" and rest == ["-"]:
+            serializer = self.item_serializers[key](data=value)
+            serializer.is_valid(raise_exception=True)
+            value = serializer.validated_data
+            value.pop("id", None)
+        elif key in self.item_serializers and op == "remove" and len(rest) == 1:
+            pk = rest[0]
+        elif (
+            key in self.item_serializers
+            and op == "replace"
+            and len(rest) == 2
+            and rest[1] in ("text", "type")
+        ):
+            pk, field = rest
+            serializer_field = self.item_serializers[key]().fields[field]
+            value = serializer_field.run_validation(value)
+            field = serializer_field.source
+        else:
+            raise ValidationError({"path": "Unsupported operation path"})
+
+        if pk is not None:
+            if not pk.isdigit():
+                raise ValidationError({"path": "Wrong id"})
+            pk = int(pk)
+        return {"op": op, "key": key, "id": pk, "field": field, "value": value}
+
+
+class QuestHistoryModelSerializer(ModelSerializer):
+    tasks = TaskUpdateModelSerializer(many=True, read_only=True)
+    errors = ErrorModelSerializer(many=True, read_only=True)
+    problems = ProblemModelSerializer(many=True, read_only=True)
+    knowledge = KnowledgeModelSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Quest
+        fields = (
+            "id",
+            "created_at",
+            "completed_at",
+            "last_update",
+            "origin",
+            "theme",
+            "tasks",
+            "errors",
+            "problems",
+            "knowledge",
+        )
+
+
+class OriginModelSerializer(ModelSerializer):
+    class Meta:
+        model = Origin
+        fields = (
+            "id",
+            "name",
+            "status",
+            "origin",
+            "weight",
+            "created_at",
+            "last_extracted_at",
+        )
+
+
+class DayStatsModelSerializer(ModelSerializer):
+    class Meta:
+        model = DayStats
+        exclude = ("id",)
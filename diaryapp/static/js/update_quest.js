@@ -1,9 +1,9 @@
 const QUEST_DATA = JSON.parse(document.getElementById("quest_data").textContent);
 
-async function putQuest(items) {
+async function patchQuest(operations) {
     const response = await fetch(ENDPOINT, {
-        method: "PUT",
-        body: JSON.stringify(items),
+        method: "PATCH",
+        body: JSON.stringify(operations),
         headers: {
             "Content-Type": "application/json"
         }
@@ -49,18 +49,24 @@ class Task {
 
 
 class Item { 
-    constructor(containerId, types, currentText="", selectedType=undefined) {
+    constructor(containerId, types, currentText="", selectedType=undefined, itemId=undefined) {
         this.textarea = document.createElement("textarea");
         this.textarea.textContent = currentText;
 
         this.select = document.createElement("select");
+        // Untyped items keep the empty option: otherwise the select falls back to the first type
+        // and saving would assign a type the user never picked
+        const noType = document.createElement("option");
+        noType.textContent = "—";
+        noType.value = "";
+        this.select.append(noType);
         for (const type in types) {
             const option = document.createElement("option");
             option.textContent = types[type];
             option.value = type;
             this.select.append(option);
         };
-        this.select.value = selectedType;
+        this.select.value = selectedType ?? "";
 
         this.removeButton = document.createElement("button");
         this.removeButton.textContent = "remove";
@@ -69,6 +75,9 @@ class Item {
         });
 
         this.item = document.createElement("div");
+        if (itemId !== undefined) {
+            this.item.dataset.id = itemId;
+        };
         this.item.classList.add("item-container__item");
         this.item.append(this.textarea, this.select, this.removeButton);
         
@@ -99,7 +108,7 @@ class Init {
     initItems() {
         this.itemsMap.forEach(([key, _, containerId, types]) => {
             QUEST_DATA[key].forEach(itemData => {
-                new Item(containerId, types, itemData.text, itemData.type);
+                new Item(containerId, types, itemData.text, itemData.type, itemData.id);
             });
         });
     };
@@ -113,34 +122,45 @@ class Init {
         });
 
         document.getElementById("save-quest").addEventListener("click", async () => {
-            const body = {
-                tasks: [],
-                errors: [],
-                problems: [],
-                knowledge: [],
+            const operations = this.collectOperations();
+            if (!operations.length || await patchQuest(operations)) {
+                document.location.href = REDIRECT_URL;
             };
-            
-            this.itemsMap.forEach(([key, _, containerId, __]) => {
-                Array.from(document.getElementById(containerId).getElementsByTagName("div")).forEach(item => {
-                    body[key].push({
-                        text: item.getElementsByTagName("textarea")[0].value,
-                        type: item.getElementsByTagName("select")[0].value
-                    });
-                });
+        });
+    };
+
+    collectOperations() {
+        // Only changes against QUEST_DATA are sent, see QuestPatchOperationSerializer
+        const operations = [];
+        this.itemsMap.forEach(([key, _, containerId, __]) => {
+            const stored = new Map(QUEST_DATA[key].map(itemData => [String(itemData.id), itemData]));
+            Array.from(document.getElementById(containerId).getElementsByTagName("div")).forEach(item => {
+                const text = item.getElementsByTagName("textarea")[0].value;
+                const type = item.getElementsByTagName("select")[0].value || null;
+                const itemData = stored.get(item.dataset.id);
+                if (itemData === undefined) {
+                    operations.push({op: "add", path: `/${key}/-`, value: {text: text, type: type}});
+                    return;
+                };
+                stored.delete(item.dataset.id);
+                if ((itemData.text ?? "") !== text) {
+                    operations.push({op: "replace", path: `/${key}/${itemData.id}/text`, value: text});
+                };
+                if ((itemData.type ?? null) !== type) {
+                    operations.push({op: "replace", path: `/${key}/${itemData.id}/type`, value: type});
+                };
             });
-            Array.from(document.getElementById(Task.containerId).getElementsByTagName("div")).forEach((task, index) => {
-                console.log(task.getElementsByTagName("input")[0].value);
-                body.tasks.push({
-                    id: task.id,
-                    text: QUEST_DATA.tasks[index].text,
-                    status: task.getElementsByTagName("input")[0].checked ? 1 : 0,
-                    type: QUEST_DATA.tasks[index].type
-                });
+            stored.forEach(itemData => {
+                operations.push({op: "remove", path: `/${key}/${itemData.id}`});
             });
-            if (await putQuest(body)) {
-                document.location.href = REDIRECT_URL;
+        });
+        QUEST_DATA.tasks.forEach(taskData => {
+            const status = document.getElementById(`task-${taskData.id}`).checked ? 1 : 0;
+            if (status !== taskData.status) {
+                operations.push({op: "replace", path: `/tasks/${taskData.id}/status`, value: status});
             };
         });
+        return operations;
     };
 };
 
@@ -0,0 +1,278 @@
+from collections import Counter, defaultdict
+from datetime import date as Date
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .item_types import item_types
+from .models import DayStats, Quest, QuestItem, Task
+
+
+class DayStatsDelta:
+    """
+    Накопитель изменений DayStats. Изменения собираются по дням и записываются
+    одним apply() в текущей транзакции: строки дней читаются SELECT ... FOR UPDATE и пишутся одним bulk_update,
+    так что параллельные apply за тот же день не затирают друг друга. Недостающие дни вставляются
+    с пропуском конфликта по date (INSERT ... ON CONFLICT DO NOTHING) и перечитываются под блокировкой.
+    Строка дня, у которого не осталось квестов, удаляется.
+
+    Все величины относятся ко дню создания квеста (Quest.created_date).
+    Типы передаются id справочника ItemType; в DayStats они записываются ключами types.json.
+    """
+
+    def __init__(self):
+        self.scalars = defaultdict(Counter)
+        self.task_types = defaultdict(Counter)
+        self.error_types = defaultdict(Counter)
+
+    def add_quest(self, date: Date, completed: bool = False, count: int = 1):
+        self.scalars[date]["quests_created"] += count
+        if completed:
+            self.complete_quest(date, count)
+
+    def complete_quest(self, date: Date, count: int = 1):
+        self.scalars[date]["quests_completed"] += count
+
+    def add_task(self, date: Date, type_id: int, status: int, count: int = 1):
+        self.scalars[date]["tasks_total"] += count
+        if status:
+            self.scalars[date]["tasks_done"] += count
+        self.task_types[date][type_id, str(status)] += count
+
+    def add_item(self, date: Date, key: str, type_id: int | None, count: int = 1):
+        """
+        param:
+        key (str): errors, problems или knowledge.
+        """
+        self.scalars[date][key] += count
+        if key == "errors":
+            self.error_types[date][type_id] += count
+
+    def remove_quest(self, quest: Quest):
+        """
+        Вычитает вклад квеста целиком. Вызывается до удаления квеста.
+        """
+        date = quest.created_date
+        self.add_quest(date, bool(quest.completed_at), -1)
+        for type_, status, count in (
+            quest.tasks.values_list("type", "status").annotate(Count("id")).order_by()
+        ):
+            self.add_task(date, type_, status, -count)
+        for kind, type_, count in (
+            quest.items.values_list("kind", "type").annotate(Count("id")).order_by()
+        ):
+            self.add_item(date, QuestItem.KIND_KEYS[kind], type_, -count)
+
+    def apply(self):
+        dates = set(self.scalars) | set(self.task_types) | set(self.error_types)
+        if not dates:
+            return
+        existing = self._lock(dates)
+        missing = dates - set(existing)
+        if missing:
+            # строку дня мог вставить параллельный запрос: конфликт по date пропускаем и читаем её
+            DayStats.objects.bulk_create(
+                [DayStats(date=date) for date in sorted(missing)], ignore_conflicts=True
+            )
+            existing.update(self._lock(missing))
+        to_update, to_delete = [], []
+        for stats in existing.values():
+            self._merge(stats)
+            # дня без квестов в сводке нет, как и после rebuild_day_stats
+            (to_update if stats.quests_created else to_delete).append(stats)
+        if to_delete:
+            DayStats.objects.filter(pk__in=[stats.pk for stats in to_delete]).delete()
+        if to_update:
+            DayStats.objects.bulk_update(
+                to_update,
+                [
+                    field.name
+                    for field in DayStats._meta.concrete_fields
+                    if field.name not in ("id", "date")
+                ],
+            )
+        self.scalars.clear()
+        self.task_types.clear()
+        self.error_types.clear()
+
+    @staticmethod
+    def _lock(dates) -> dict:
+        """
+        Читает строки дней под блокировкой (в порядке дат, чтобы параллельные apply не ждали друг друга по кругу).
+        """
+        return {
+            stats.date: stats
+            for stats in DayStats.objects.select_for_update()
+            .filter(date__in=dates)
+            .order_by("date")
+        }
+
+    def _merge(self, stats: DayStats):
+        for field, count in self.scalars[stats.date].items():
+            setattr(stats, field, getattr(stats, field) + count)
+
+        task_types = stats.task_types
+        for (type_id, status), count in self.task_types[stats.date].items():
+            type_ = item_types.name(type_id)
+            statuses = task_types.setdefault(type_, {})
+            statuses[status] = statuses.get(status, 0) + count
+            if not statuses[status]:
+                del statuses[status]
+            if not statuses:
+                del task_types[type_]
+
+        error_types = stats.error_types
+        for type_id, count in self.error_types[stats.date].items():
+            type_ = item_types.name(type_id) or ""
+            error_types[type_] = error_types.get(type_, 0) + count
+            if not error_types[type_]:
+                del error_types[type_]
+
+
+def rebuild_day_stats(date_from: Date, date_to: Date) -> int:
+    """
+    Пересчитывает DayStats за период с нуля сгруппированными запросами (без обхода строк в Python).
+    Вызывается внутри транзакции.
+
+    return:
+    int: количество записанных дней.
+    """
+    delta = DayStatsDelta()
+    for date, created, completed in (
+        Quest.objects.filter(created_date__range=(date_from, date_to))
+        .values_list("created_date")
+        .annotate(Count("id"), Count("completed_at"))
+        .order_by()
+    ):
+        delta.add_quest(date, count=created)
+        delta.complete_quest(date, completed)
+    for date, type_, status, count in (
+        Task.objects.filter(quest__created_date__range=(date_from, date_to))
+        .values_list("quest__created_date", "type", "status")
+        .annotate(Count("id"))
+        .order_by()
+    ):
+        delta.add_task(date, type_, status, count)
+    for date, kind, type_, count in (
+        QuestItem.objects.filter(quest__created_date__range=(date_from, date_to))
+        .values_list("quest__created_date", "kind", "type")
+        .annotate(Count("id"))
+        .order_by()
+    ):
+        delta.add_item(date, QuestItem.KIND_KEYS[kind], type_, count)
+
+    DayStats.objects.filter(date__range=(date_from, date_to)).delete()
+    days = len(delta.scalars)
+    delta.apply()
+    return days
+
+
+def quest_counters() -> dict:
+    """
+    Выражения для пересчёта счётчиков квеста по задачам и элементам (коррелированные подзапросы).
+
+    return:
+    Dict[str, Expression]: выражение по имени поля-счётчика.
+    """
+
+    def count(queryset):
+        return Coalesce(
+            Subquery(
+                queryset.filter(quest=OuterRef("pk"))
+                .order_by()
+                .values("quest")
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            0,
+        )
+
+    counters = {
+        "tasks_total": count(Task.objects.all()),
+        "tasks_done": count(Task.objects.filter(~Q(status=0))),
+    }
+    for key, kind in QuestItem.KINDS.items():
+        counters[Quest.counter(key)] = count(QuestItem.objects.filter(kind=kind))
+    return counters
+
+
+def recount_quests(id_from: int, id_to: int) -> int:
+    """
+    Чинит счётчики квестов с id в (id_from, id_to]: переписываются только разошедшиеся.
+    Вызывается внутри транзакции.
+
+    return:
+    int: количество исправленных квестов.
+    """
+    counters = quest_counters()
+    drifted = list(
+        Quest.objects.filter(pk__gt=id_from, pk__lte=id_to)
+        .alias(
+            **{f"actual_{name}": expression for name, expression in counters.items()}
+        )
+        .exclude(**{name: F(f"actual_{name}") for name in counters})
+        .values_list("pk", flat=True)
+    )
+    if drifted:
+        Quest.objects.filter(pk__in=drifted).update(**counters)
+    return len(drifted)
+
+
+ORIGIN_TOTALS = (
+    "quests",
+    "completed",
+    "tasks_total",
+    "tasks_done",
+    "errors",
+    "problems",
+    "knowledge",
+)
+
+
+def origin_totals(origin_id: int) -> dict:
+    """
+    Итоги источника одним запросом (UNION ALL двух агрегатов, оба идут по индексу (origin, created_at)):
+    строка итогов по счётчикам квестов и строки «ошибок по типу». Объединяются в одном запросе,
+    потому что итоги нельзя считать по соединению с ошибками — суммы счётчиков размножились бы.
+
+    return:
+    dict: quests, completed, tasks_total, tasks_done, errors, problems, knowledge
+        и error_types — [{"type": ключ types.json или None, "count": ...}] по убыванию count.
+    """
+    # колонки обеих частей: поле группировки, метка строки, затем значения в порядке annotate
+    totals = (
+        Quest.objects.filter(origin=origin_id)
+        .order_by()
+        .values("origin")
+        .annotate(
+            row=Value("totals"),
+            quests=Count("pk"),
+            completed=Count("completed_at"),
+            tasks_total_sum=Sum("tasks_total"),
+            tasks_done_sum=Sum("tasks_done"),
+            **{f"{key}_sum": Sum(Quest.counter(key)) for key in QuestItem.KINDS},
+        )
+    )
+    zeros = {f"zero_{i}": Value(0) for i in range(len(ORIGIN_TOTALS) - 1)}
+    errors_by_type = (
+        QuestItem.objects.filter(
+            quest__origin=origin_id, kind=QuestItem.KINDS["errors"]
+        )
+        .order_by()
+        .values("type")
+        .annotate(row=Value("errors"), count=Count("pk"), **zeros)
+    )
+    result = dict.fromkeys(ORIGIN_TOTALS, 0)
+    result["error_types"] = []
+    rows = totals.values_list("origin", *totals.query.annotations).union(
+        errors_by_type.values_list("type", *errors_by_type.query.annotations), all=True
+    )
+    for key, row, *values in rows:
+        if row == "totals":
+            result.update(zip(ORIGIN_TOTALS, values))
+        else:
+            result["error_types"].append(
+                {"type": item_types.name(key), "count": values[0]}
+            )
+    result["error_types"].sort(key=lambda item: -item["count"])
+    return result
@@ -1,8 +1,41 @@
+from collections import Counter
+from contextlib import closing, contextmanager
+from datetime import timedelta
+from json import dumps, loads
+from pathlib import Path
 from platform import system
+from sqlite3 import connect
 from subprocess import Popen, run, PIPE
+from tempfile import TemporaryDirectory
 from typing import Dict, Tuple, Iterable, List
+from unittest import skipUnless
+from unittest.mock import patch
 
-from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Max, Min
+from django.db.transaction import atomic
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import localdate, now
+
+from diary.backends.sqlite3.base import DatabaseWrapper as SQLiteWrapper
+
+from .analytics import data_version
+from .backup import DiaryImport, export_lines
+from .bulk import bulk_insert
+from .cache import quest_cache
+from .item_types import item_types
+from .management.commands.benchmark import QuestWorkload, run_threads
+from .models import TYPES, Day, DayStats, ItemType, Origin, Quest, QuestItem, Task
+from .retry import write_retry
+from .search import search
+from .statistics import (
+    ORIGIN_TOTALS,
+    origin_totals,
+    rebuild_day_stats,
+    recount_quests,
+)
 
 
 def up_to_date_fixtures(map_: Dict[Tuple[str, str], Iterable]) -> List[str]:
@@ -45,3 +78,1165 @@ def up_to_date_fixtures(map_: Dict[Tuple[str, str], Iterable]) -> List[str]:
 
     print(fixtures)
     return fixtures
+
+
+class DiaryTestCase(TestCase):
+    """
+    Основа тестов, которые должны проходить и на SQLite, и на PostgreSQL (DB_ENGINE).
+    Кэши процесса (справочник типов, представления квестов) сбрасываются перед каждым тестом:
+    откат транзакции теста их не касается.
+    """
+
+    def setUp(self):
+        item_types.clear()
+        quest_cache.cache.clear()
+        self.origin = Origin.objects.create(name="origin")
+
+    def create_quest(self, tasks=("general",), **items) -> Quest:
+        """
+        Создаёт квест через API, как это делает клиент.
+
+        param:
+        tasks (Iterable[str]): типы задач.
+        items (Dict[str, Iterable[Tuple[str, str | None]]]): (текст, тип) ошибок, проблем и знаний по ключам.
+
+        return:
+        Quest
+        """
+        response = self.client.post(
+            "/api/quest/create",
+            {
+                "theme": "theme",
+                "origin": self.origin.pk,
+                "tasks": [
+                    {"text": f"task {number}", "type": type_}
+                    for number, type_ in enumerate(tasks)
+                ],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        quest = Quest.objects.latest("pk")
+        operations = [
+            {"op": "add", "path": f"/{key}/-", "value": {"text": text, "type": type_}}
+            for key, values in items.items()
+            for text, type_ in values
+        ]
+        if operations:
+            response = self.client.patch(
+                f"/api/quest/{quest.pk}", operations, content_type="application/json"
+            )
+            self.assertEqual(response.status_code, 200, response.content)
+            quest.refresh_from_db()
+        return quest
+
+
+class BulkInsertTest(DiaryTestCase):
+    def test_assigns_pks(self):
+        """
+        Объекты получают id сразу (на PostgreSQL — из последовательности, строки идут COPY),
+        на них можно ссылаться по FK, а последовательность продолжает выдавать новые id.
+        """
+        type_id = item_types.id("tasks", "general")
+        quests = [Quest(theme=f"bulk {number}", tasks_total=1) for number in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            bulk_insert(Quest, quests)
+            bulk_insert(
+                Task,
+                [Task(quest=quest, type_id=type_id, text="bulk") for quest in quests],
+            )
+        inserts = [query for query in queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 0 if connection.vendor == "postgresql" else 2)
+        self.assertEqual(len({quest.pk for quest in quests}), 3)
+        self.assertEqual(
+            set(Task.objects.values_list("quest_id", flat=True)),
+            {quest.pk for quest in quests},
+        )
+        self.assertFalse(quests[0]._state.adding)
+        self.assertGreater(Quest.objects.create().pk, max(quest.pk for quest in quests))
+
+    def test_empty(self):
+        self.assertEqual(bulk_insert(Quest, []), [])
+
+
+class SearchTest(DiaryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quest = self.create_quest(
+            errors=[("forgot chlorophyll", "knowledge")],
+            knowledge=[("photosynthesis needs light", None)],
+        )
+        Day.objects.create(
+            created_at=now(),
+            created_date=localdate(),
+            content="walked photosynthetically",
+        )
+
+    def test_kinds(self):
+        results = search("chlorophyll")
+        self.assertEqual(
+            [(result["kind"], result["quest"]) for result in results],
+            [("error", self.quest.pk)],
+        )
+        self.assertIn("[chlorophyll]", results[0]["snippet"])
+        self.assertEqual(str(results[0]["date"]), self.quest.created_date.isoformat())
+
+    def test_prefix(self):
+        results = search("photosynth")
+        self.assertEqual({result["kind"] for result in results}, {"knowledge", "day"})
+        day = next(result for result in results if result["kind"] == "day")
+        self.assertIsNone(day["quest"])
+        self.assertEqual(str(day["date"]), localdate().isoformat())
+
+    def test_all_words_required(self):
+        self.assertEqual(search("forgot light"), [])
+        self.assertEqual(len(search("needs light")), 1)
+
+    def test_index_follows_changes(self):
+        item = self.quest.items.get(kind="e")
+        self.client.patch(
+            f"/api/quest/{self.quest.pk}",
+            [{"op": "replace", "path": f"/errors/{item.pk}/text", "value": "stomata"}],
+            content_type="application/json",
+        )
+        self.assertEqual(search("chlorophyll"), [])
+        self.assertEqual(len(search("stomata")), 1)
+        self.quest.delete()
+        self.assertEqual(search("stomata"), [])
+
+    def test_empty_query(self):
+        self.assertEqual(search("*:&"), [])
+
+
+class DiaryImportTest(DiaryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_quest(
+            ("general", "creative"),
+            errors=[("error", "knowledge"), ("untyped", None)],
+            problems=[("problem", None)],
+        )
+        self.create_quest(knowledge=[("knowledge", None)])
+        Day.objects.create(created_at=now(), created_date=localdate(), content="note")
+
+    def counts(self) -> tuple:
+        return tuple(
+            model.objects.count() for model in (Origin, Quest, Task, QuestItem, Day)
+        )
+
+    def day_stats(self) -> list:
+        return list(
+            DayStats.objects.order_by("date").values_list(
+                "date",
+                "quests_created",
+                "tasks_total",
+                "errors",
+                "error_types",
+                "task_types",
+            )
+        )
+
+    def test_round_trip(self):
+        lines = list(export_lines())
+        counts, stats = self.counts(), self.day_stats()
+        Quest.objects.all().delete()
+        Origin.objects.all().delete()
+        Day.objects.all().delete()
+        DayStats.objects.all().delete()
+
+        imported = DiaryImport(batch_size=1).load(lines)
+
+        self.assertEqual(
+            imported, {"origins": 1, "quests": 2, "days": 1, "days merged": 0}
+        )
+        self.assertEqual(self.counts(), counts)
+        self.assertEqual(self.day_stats(), stats)
+        self.assertEqual(list(export_lines()), lines)
+
+    def test_unknown_type(self):
+        """
+        Тип, которого уже нет в types.json, добавляется в справочник, а не ломает загрузку.
+        """
+        record = loads(next(line for line in export_lines() if '"quest"' in line))
+        record["quest"]["tasks"][0]["type"] = "study"
+        DiaryImport().load([dumps(record)])
+        self.assertTrue(ItemType.objects.filter(section="tasks", name="study").exists())
+        self.assertEqual(Task.objects.filter(type__name="study").count(), 1)
+
+    def test_days_merged_by_date(self):
+        record = {
+            "day": {
+                "created_at": now().isoformat(),
+                "created_date": localdate().isoformat(),
+                "content": "imported",
+            }
+        }
+        importer = DiaryImport()
+        importer.load([dumps(record)] * 2)
+        self.assertEqual(
+            importer.counts, {"origins": 0, "quests": 0, "days": 0, "days merged": 1}
+        )
+        self.assertEqual(Day.objects.get().content, "note\n\nimported")
+        self.assertEqual(self.client.get("/quest/").status_code, 200)
+
+    def test_bad_line_rolls_back(self):
+        lines = [*export_lines(), "{"]
+        counts = self.counts()
+        with self.assertRaisesRegex(ValueError, f"line {len(lines)}"):
+            DiaryImport().load(lines)
+        self.assertEqual(self.counts(), counts)
+
+
+def write_statements(queries) -> list:
+    """
+    return:
+    List[Tuple[str, str]]: (оператор, таблица) пишущих запросов из CaptureQueriesContext.
+    """
+    statements = []
+    for query in queries:
+        words = query["sql"].replace('"', "").split()
+        if words[0] in ("INSERT", "UPDATE", "DELETE"):
+            table = words[2] if words[0] in ("INSERT", "DELETE") else words[1]
+            statements.append((words[0], table))
+    return statements
+
+
+class QuestPutTest(DiaryTestCase):
+    """
+    PUT пишет только изменения и пакетами: число запросов не зависит от числа элементов.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.quest = self.create_quest(
+            ("general", "creative"),
+            errors=[("first", None), ("second", None)],
+            problems=[("problem", None)],
+        )
+        self.url = f"/api/quest/{self.quest.pk}"
+        self.data = self.client.get(self.url).json()
+
+    def put(self, queries: int) -> dict:
+        with CaptureQueriesContext(connection) as captured:
+            with self.assertNumQueries(queries):
+                response = self.client.put(
+                    self.url, self.data, content_type="application/json"
+                )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.writes = write_statements(captured)
+        return response.json()
+
+    def test_no_changes(self):
+        # квест, SAVEPOINT, квест под блокировкой, элементы, задачи, RELEASE, задачи для ответа
+        data = self.put(7)
+        self.assertEqual(self.writes, [])
+        self.assertEqual(data["errors"], self.data["errors"])
+
+    def test_changes(self):
+        self.data["errors"][0]["text"] = "changed"
+        del self.data["errors"][1]
+        self.data["knowledge"].append({"text": "new", "type": "concept"})
+        self.data["tasks"][0]["status"] = 1
+        self.data["tasks"][1]["status"] = 1
+
+        data = self.put(16)
+
+        self.assertEqual(
+            self.writes,
+            [
+                ("DELETE", "diaryapp_questitem"),
+                ("INSERT", "diaryapp_questitem"),
+                ("UPDATE", "diaryapp_questitem"),
+                ("UPDATE", "diaryapp_task"),
+                ("UPDATE", "diaryapp_daystats"),
+                ("UPDATE", "diaryapp_quest"),
+            ],
+        )
+        self.assertEqual([error["text"] for error in data["errors"]], ["changed"])
+        self.assertEqual([item["type"] for item in data["knowledge"]], ["concept"])
+        self.quest.refresh_from_db()
+        self.assertEqual(
+            (
+                self.quest.tasks_done,
+                self.quest.errors_total,
+                self.quest.knowledge_total,
+            ),
+            (2, 1, 1),
+        )
+        self.assertIsNotNone(self.quest.completed_at)
+        stats = DayStats.objects.get(date=self.quest.created_date)
+        self.assertEqual(
+            (stats.quests_completed, stats.tasks_done, stats.errors, stats.knowledge),
+            (1, 2, 1, 1),
+        )
+
+
+class QuestShapeTest(DiaryTestCase):
+    """
+    include и fields[...] в GET и PUT: ключи и размер ответа, число запросов.
+    Коллекции вне include не читаются из базы.
+    """
+
+    full = {"tasks", "errors", "problems", "knowledge", "types"}
+
+    def setUp(self):
+        super().setUp()
+        self.quest = self.create_quest(
+            ("general", "creative"),
+            errors=[("error", "logic")],
+            problems=[("problem", None)],
+            knowledge=[("knowledge", None)],
+        )
+        self.url = f"/api/quest/{self.quest.pk}"
+        self.full_size = len(self.client.get(self.url).content)
+        quest_cache.cache.clear()
+
+    def request(self, method: str, params: str, queries: int, data=None) -> dict:
+        with CaptureQueriesContext(connection) as captured:
+            with self.assertNumQueries(queries):
+                response = getattr(self.client, method)(
+                    f"{self.url}?{params}", data, content_type="application/json"
+                )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.size = len(response.content)
+        self.items_queried = any(
+            "diaryapp_questitem" in query["sql"] for query in captured
+        )
+        return response.json()
+
+    def test_get_full(self):
+        # квест, задачи, все элементы одним запросом
+        data = self.request("get", "", 3)
+        self.assertEqual(set(data), self.full)
+        self.assertEqual(self.size, self.full_size)
+
+    def test_get_include_nothing(self):
+        data = self.request("get", "include=", 2)
+        self.assertEqual(set(data), {"tasks"})
+        self.assertFalse(self.items_queried)
+        self.assertLess(self.size, self.full_size)
+
+    def test_get_include_errors(self):
+        data = self.request("get", "include=errors", 3)
+        self.assertEqual(set(data), {"tasks", "errors"})
+        self.assertEqual(data["errors"][0]["type"], "logic")
+        self.assertLess(self.size, self.full_size)
+
+    def test_get_task_fields(self):
+        data = self.request("get", "fields[tasks]=id,status", 3)
+        self.assertEqual(set(data), self.full)
+        self.assertEqual([set(task) for task in data["tasks"]], [{"id", "status"}] * 2)
+        self.assertLess(self.size, self.full_size)
+
+    def test_get_from_cache(self):
+        """
+        Форма вырезается из закэшированного полного представления без чтения коллекций.
+        """
+        self.client.get(self.url)
+        data = self.request("get", "include=errors&fields[tasks]=id,status", 1)
+        self.assertEqual(set(data), {"tasks", "errors"})
+        self.assertEqual(set(data["tasks"][0]), {"id", "status"})
+
+    def test_put_include_nothing(self):
+        """
+        Без коллекций в include PUT меняет только задачи, не читая и не трогая элементы.
+        """
+        tasks = self.client.get(f"{self.url}?include=").json()["tasks"]
+        quest_cache.cache.clear()
+        tasks[0]["status"] = 1
+        data = self.request("put", "include=", 10, {"tasks": tasks})
+        self.assertEqual(set(data), {"tasks"})
+        self.assertEqual(data["tasks"][0]["status"], 1)
+        self.assertFalse(self.items_queried)
+        self.assertEqual(self.quest.items.count(), 3)
+
+    def test_put_include_errors(self):
+        body = self.client.get(f"{self.url}?include=errors").json()
+        body["errors"].append({"text": "another", "type": None})
+        data = self.request("put", "include=errors", 12, body)
+        self.assertEqual(set(data), {"tasks", "errors"})
+        self.assertEqual(len(data["errors"]), 2)
+        # problems и knowledge нет в теле, но они не удаляются
+        self.assertEqual(self.quest.items.count(), 4)
+
+    def test_put_task_fields(self):
+        body = self.client.get(self.url).json()
+        body["tasks"][1]["status"] = 1
+        data = self.request("put", "fields[tasks]=id,status", 11, body)
+        self.assertEqual(set(data), self.full)
+        self.assertEqual(
+            data["tasks"],
+            [{"id": task["id"], "status": task["status"]} for task in body["tasks"]],
+        )
+
+    def test_invalid(self):
+        for params in ("include=tasks", "fields[tasks]=id,unknown", "fields[errors]="):
+            with self.subTest(params=params):
+                response = self.client.get(f"{self.url}?{params}")
+                self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(connection.vendor == "sqlite", "busy_timeout = 0 is SQLite-only")
+@override_settings(
+    WRITE_RETRY_ATTEMPTS=30, WRITE_RETRY_BASE_DELAY=0.005, WRITE_RETRY_MAX_DELAY=0.1
+)
+class WriteRetryTest(TransactionTestCase):
+    """
+    Параллельные PUT и создание квестов на файловой базе SQLite без ожидания блокировки
+    (busy_timeout = 0): каждый конфликт доходит до приложения и повторяется write_retry,
+    а счётчики квестов и DayStats после всех повторов сходятся с пересчётом.
+    """
+
+    writers = 4
+    operations = 15
+
+    def setUp(self):
+        item_types.clear()
+        quest_cache.cache.clear()
+        write_retry.reset_stats()
+        # схема копируется из тестовой базы (в памяти) в файл; соединение с тестовой базой
+        # сохраняется, иначе база в памяти пропадёт вместе с ним
+        self.memory = connections[DEFAULT_DB_ALIAS]
+        self.memory.ensure_connection()
+        self.directory = TemporaryDirectory()
+        path = f"{self.directory.name}/db.sqlite3"
+        with closing(connect(path)) as target:
+            self.memory.connection.backup(target)
+        settings_dict = self.memory.settings_dict
+        self.configured = {key: settings_dict[key] for key in ("NAME", "OPTIONS")}
+        pragmas = {
+            **self.configured["OPTIONS"].get("pragmas", {}),
+            "journal_mode": "WAL",
+            "busy_timeout": 0,
+        }
+        settings_dict.update(
+            NAME=path, OPTIONS={**self.configured["OPTIONS"], "pragmas": pragmas}
+        )
+        del connections[DEFAULT_DB_ALIAS]
+
+    def tearDown(self):
+        connection.close()
+        self.memory.settings_dict.update(self.configured)
+        connections[DEFAULT_DB_ALIAS] = self.memory
+        self.directory.cleanup()
+
+    def test_concurrent_writes(self):
+        workload = QuestWorkload(10)
+        results = run_threads(
+            {
+                "saves": [(workload.save, workload.quests)] * self.writers,
+                "creates": [(workload.create, workload.quests)] * self.writers,
+            },
+            self.operations,
+        )
+
+        self.assertEqual([result["errors"] for result in results.values()], [0, 0])
+        stats = write_retry.stats()
+        self.assertEqual(stats["failures"], 0)
+        self.assertGreater(stats["retries"], 0)
+        self.assertEqual(Quest.objects.count(), 10 + self.writers * self.operations)
+
+        with atomic():
+            self.assertEqual(
+                recount_quests(0, Quest.objects.aggregate(Max("pk"))["pk__max"]), 0
+            )
+            stored = list(DayStats.objects.order_by("date").values_list())
+            dates = Quest.objects.aggregate(Min("created_date"), Max("created_date"))
+            rebuild_day_stats(dates["created_date__min"], dates["created_date__max"])
+            rebuilt = list(DayStats.objects.order_by("date").values_list())
+        self.assertEqual([row[1:] for row in stored], [row[1:] for row in rebuilt])
+
+
+class QuestDeleteTest(DiaryTestCase):
+    def test_cache_invalidated(self):
+        quest = self.create_quest()
+        self.client.get(f"/api/quest/{quest.pk}")
+        key = quest_cache.key(quest.pk)
+        self.assertIsNotNone(quest_cache.cache.get(key))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"/quest/{quest.pk}/delete", {"date": quest.created_date.isoformat()}
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Quest.objects.filter(pk=quest.pk).exists())
+        self.assertIsNone(quest_cache.cache.get(key))
+
+
+class QuestHistoryTest(DiaryTestCase):
+    """
+    /api/quests: страница любой глубины и любого размера — три запроса
+    (квесты, задачи, элементы).
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.quests = [
+            self.create_quest(
+                ("general", "creative"), errors=[(f"error {number}", None)]
+            ).pk
+            for number in range(12)
+        ]
+
+    def pages(self, page_size: int) -> list:
+        """
+        return:
+        List[List[int]]: id квестов по страницам.
+        """
+        pages = []
+        url = f"/api/quests?page_size={page_size}"
+        while url:
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            pages.append([quest["id"] for quest in data["results"]])
+            url = data["next"]
+        return pages
+
+    def test_same_queries_per_page(self):
+        for page_size, sizes in ((5, [5, 5, 2]), (2, [2] * 6)):
+            with self.subTest(page_size=page_size):
+                pages = self.pages(page_size)
+                self.assertEqual([len(page) for page in pages], sizes)
+                self.assertEqual(
+                    [pk for page in pages for pk in page], self.quests[::-1]
+                )
+
+    def test_deep_cursor(self):
+        first = self.client.get("/api/quests?page_size=10").json()
+        self.assertEqual(len(first["results"]), 10)
+        with self.assertNumQueries(3):
+            deep = self.client.get(first["next"]).json()
+        self.assertEqual([quest["id"] for quest in deep["results"]], self.quests[1::-1])
+        self.assertIsNone(deep["next"])
+
+    def test_invalid_cursor(self):
+        for cursor in ("not-base64!", "bm90IGpzb24=", "WzFd"):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f"/api/quests?cursor={cursor}")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("cursor", response.json())
+
+
+class QuestPatchTest(DiaryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.quest = self.create_quest(
+            ("general", "creative"),
+            errors=[("error", None)],
+            problems=[("problem", "concept")],
+        )
+        self.url = f"/api/quest/{self.quest.pk}"
+        self.error = self.quest.items.get(kind="e")
+        self.problem = self.quest.items.get(kind="p")
+        self.tasks = list(self.quest.tasks.order_by("pk"))
+
+    def patch(self, operations, status_code: int = 200) -> dict:
+        response = self.client.patch(
+            self.url, operations, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status_code, response.content)
+        self.quest.refresh_from_db()
+        return response.json()
+
+    def test_add(self):
+        data = self.patch(
+            [
+                {
+                    "op": "add",
+                    "path": "/knowledge/-",
+                    "value": {"text": "new", "type": "skill"},
+                }
+            ]
+        )
+        self.assertEqual(
+            [(item["text"], item["type"]) for item in data["knowledge"]],
+            [("new", "skill")],
+        )
+        self.assertEqual(self.quest.knowledge_total, 1)
+        self.assertEqual(DayStats.objects.get().knowledge, 1)
+
+    def test_remove(self):
+        data = self.patch([{"op": "remove", "path": f"/errors/{self.error.pk}"}])
+        self.assertEqual(data["errors"], [])
+        self.assertEqual(self.quest.errors_total, 0)
+        self.assertEqual(DayStats.objects.get().error_types, {})
+
+    def test_remove_unknown(self):
+        for path in ("/errors/999999", f"/problems/{self.error.pk}"):
+            with self.subTest(path=path):
+                self.patch([{"op": "remove", "path": path}], 400)
+                self.assertEqual(self.quest.items.count(), 2)
+                self.assertEqual(self.quest.errors_total, 1)
+
+    def test_replace_type(self):
+        data = self.patch(
+            [
+                {
+                    "op": "replace",
+                    "path": f"/errors/{self.error.pk}/type",
+                    "value": "logic",
+                },
+                {
+                    "op": "replace",
+                    "path": f"/problems/{self.problem.pk}/type",
+                    "value": None,
+                },
+            ]
+        )
+        self.assertEqual(data["errors"][0]["type"], "logic")
+        self.assertIsNone(data["problems"][0]["type"])
+        self.assertEqual(DayStats.objects.get().error_types, {"logic": 1})
+
+    def test_replace_status(self):
+        data = self.patch(
+            [
+                {"op": "replace", "path": f"/tasks/{task.pk}/status", "value": 1}
+                for task in self.tasks
+            ]
+        )
+        self.assertEqual([task["status"] for task in data["tasks"]], [1, 1])
+        self.assertEqual(self.quest.tasks_done, 2)
+        self.assertIsNotNone(self.quest.completed_at)
+        self.assertEqual(DayStats.objects.get().quests_completed, 1)
+
+    def test_invalid(self):
+        task = self.tasks[0].pk
+        last_update = self.quest.last_update
+        for operation in (
+            {"op": "move", "path": "/errors/-", "value": {}},
+            {"op": "add", "path": "/tasks/-", "value": {"text": "task"}},
+            {"op": "add", "path": "/errors/-"},
+            {
+                "op": "add",
+                "path": "/errors/-",
+                "value": {"text": "x", "type": "unknown"},
+            },
+            {"op": "replace", "path": f"/errors/{self.error.pk}/quest", "value": 1},
+            {"op": "replace", "path": "/errors/abc/text", "value": "x"},
+            {"op": "replace", "path": f"/tasks/{task}/status", "value": "done"},
+            {"op": "replace", "path": "/tasks/999999/status", "value": 1},
+        ):
+            with self.subTest(operation=operation):
+                self.patch([operation], 400)
+        self.assertEqual(self.quest.items.count(), 2)
+        self.assertEqual(self.quest.last_update, last_update)
+
+    def test_empty(self):
+        with CaptureQueriesContext(connection) as captured:
+            data = self.patch([])
+        self.assertEqual(write_statements(captured), [])
+        self.assertEqual(len(data["errors"]), 1)
+
+
+class SQLiteBackendTest(TestCase):
+    """
+    diary.backends.sqlite3: PRAGMA из OPTIONS применяются к каждому новому соединению,
+    atomic открывает транзакцию в режиме OPTIONS["transaction_mode"].
+    """
+
+    alias = "sqlite_backend_test"
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def wrapper(self, options: dict) -> SQLiteWrapper:
+        wrapper = SQLiteWrapper(
+            {
+                **connection.settings_dict,
+                "NAME": f"{self.directory.name}/db.sqlite3",
+                "OPTIONS": options,
+            },
+            self.alias,
+        )
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pragmas(self):
+        wrapper = self.wrapper(
+            {
+                "pragmas": {
+                    "journal_mode": "WAL",
+                    "synchronous": "NORMAL",
+                    "busy_timeout": 1234,
+                }
+            }
+        )
+        with wrapper.cursor() as cursor:
+            applied = {
+                name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in ("journal_mode", "synchronous", "busy_timeout")
+            }
+        # synchronous возвращается числом: NORMAL = 1
+        self.assertEqual(
+            applied, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 1234}
+        )
+
+    def test_invalid_pragma(self):
+        for pragmas in ({"journal_mode; DROP": "WAL"}, {"busy_timeout": "1; DROP"}):
+            with self.subTest(pragmas=pragmas):
+                with self.assertRaises(ImproperlyConfigured):
+                    self.wrapper({"pragmas": pragmas}).ensure_connection()
+
+    def test_transaction_mode(self):
+        wrapper = self.wrapper({"transaction_mode": "IMMEDIATE"})
+        connections[self.alias] = wrapper
+        self.addCleanup(connections.__delitem__, self.alias)
+        with CaptureQueriesContext(wrapper) as captured:
+            with atomic(using=self.alias):
+                wrapper.cursor().execute("SELECT 1")
+        self.assertEqual(captured[0]["sql"], "BEGIN IMMEDIATE")
+
+
+class ReportCacheTest(DiaryTestCase):
+    """
+    Кэш отчётов аналитики: версия данных берётся из кэша без запросов и сдвигается записями.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.quest = self.create_quest(errors=[("error", "logic")])
+
+    def report(self, url: str, queries: int) -> dict:
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_version_without_queries(self):
+        with self.assertNumQueries(0):
+            version = data_version()
+        self.assertEqual(data_version(), version)
+
+    def test_quest_write(self):
+        self.assertEqual(self.report("/api/analytics/errors", 3)["errors"], 1)
+        self.assertEqual(self.report("/api/analytics/errors", 0)["errors"], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f"/api/quest/{self.quest.pk}",
+                [
+                    {
+                        "op": "add",
+                        "path": "/errors/-",
+                        "value": {"text": "x", "type": None},
+                    }
+                ],
+                content_type="application/json",
+            )
+        self.assertEqual(self.report("/api/analytics/errors", 3)["errors"], 2)
+
+    def test_origin_rename(self):
+        origins = self.report("/api/analytics/latency", 3)["origins"]
+        self.assertEqual([origin["name"] for origin in origins], ["origin"])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"/origin/{self.origin.pk}/update",
+                {"name": "renamed", "status": "a", "origin": "", "weight": 1},
+            )
+        self.assertEqual(response.status_code, 302)
+        origins = self.report("/api/analytics/latency", 3)["origins"]
+        self.assertEqual([origin["name"] for origin in origins], ["renamed"])
+
+
+class DayStatsDeltaTest(DiaryTestCase):
+    """
+    DayStats, поддерживаемые инкрементально при записи, совпадают с rebuild_day_stats.
+    """
+
+    def assertMatchesRebuild(self):
+        stored = self.day_stats()
+        with atomic():
+            rebuild_day_stats(localdate() - timedelta(days=30), localdate())
+        self.assertEqual(stored, self.day_stats())
+
+    @staticmethod
+    def day_stats() -> list:
+        return [row[1:] for row in DayStats.objects.order_by("date").values_list()]
+
+    def import_quest(self, days_ago: int) -> Quest:
+        record = loads(next(line for line in export_lines() if '"quest"' in line))
+        created_date = localdate() - timedelta(days=days_ago)
+        record["quest"]["created_date"] = created_date.isoformat()
+        record["quest"]["completed_at"] = None
+        record["quest"]["tasks"][0]["status"] = 1
+        DiaryImport().load([dumps(record)])
+        return Quest.objects.latest("pk")
+
+    def test_create_edit_delete(self):
+        quest = self.create_quest(
+            ("general", "creative"), errors=[("a", "logic"), ("b", None)]
+        )
+        self.assertMatchesRebuild()
+
+        self.client.post(
+            "/api/quests/batch",
+            [
+                {"origin": self.origin.pk, "tasks": [{"text": "t", "type": "puzzle"}]},
+            ]
+            * 2,
+            content_type="application/json",
+        )
+        self.client.post(
+            f"/origin/{self.origin.pk}/update", {"origin_to_quest": self.origin.name}
+        )
+        self.assertMatchesRebuild()
+
+        data = self.client.get(f"/api/quest/{quest.pk}").json()
+        data["tasks"][0]["status"] = 1
+        data["errors"][0]["type"] = "memory"
+        del data["errors"][1]
+        data["problems"].append({"text": "p", "type": "skill"})
+        self.client.put(f"/api/quest/{quest.pk}", data, content_type="application/json")
+        self.assertMatchesRebuild()
+
+        task = quest.tasks.order_by("pk").last()
+        self.client.patch(
+            f"/api/quest/{quest.pk}",
+            [{"op": "replace", "path": f"/tasks/{task.pk}/status", "value": 1}],
+            content_type="application/json",
+        )
+        self.assertMatchesRebuild()
+        self.assertEqual(DayStats.objects.get().quests_completed, 1)
+
+        old = self.import_quest(days_ago=3)
+        self.assertMatchesRebuild()
+        self.assertEqual(DayStats.objects.count(), 2)
+
+        for deleted in (old, quest):
+            self.client.post(
+                f"/quest/{deleted.pk}/delete",
+                {"date": deleted.created_date.isoformat()},
+            )
+            self.assertMatchesRebuild()
+        # строка дня без квестов удаляется, а не остаётся нулевой
+        self.assertFalse(DayStats.objects.filter(date=old.created_date).exists())
+        self.assertEqual(DayStats.objects.get().quests_created, 3)
+
+
+class ConditionalGetTest(DiaryTestCase):
+    """
+    Условные GET квеста и типов: 304 по ETag и If-Modified-Since, новый ETag после записи
+    квеста или изменения types.json.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.quest = self.create_quest(errors=[("error", "logic")])
+        self.url = f"/api/quest/{self.quest.pk}"
+
+    def get(self, url: str, status_code: int = 200, **headers):
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, status_code, response.content)
+        return response
+
+    @contextmanager
+    def changed_types(self):
+        """
+        Подменяет types.json копией с добавленным типом задачи; снимок реестра восстанавливается.
+        """
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / "types.json"
+            types = loads(TYPES.path.read_bytes())
+            types["tasks"]["extra"] = "extra"
+            path.write_text(dumps(types))
+            with patch.multiple(
+                TYPES,
+                path=path,
+                check_interval=0,
+                _snapshot=TYPES._snapshot,
+                _signature=TYPES._signature,
+            ):
+                yield
+
+    def test_quest_not_modified(self):
+        response = self.get(self.url)
+        # ответ 304 собирается без обращения к кэшу представлений: только сам квест
+        with self.assertNumQueries(1):
+            self.get(self.url, 304, if_none_match=response["ETag"])
+        self.get(self.url, 304, if_modified_since=response["Last-Modified"])
+        self.get(self.url, if_none_match='"stale"')
+
+    def test_quest_etag_after_write(self):
+        etags = [self.get(self.url)["ETag"]]
+        data = self.get(self.url).json()
+        data["errors"][0]["text"] = "changed"
+        response = self.client.put(self.url, data, content_type="application/json")
+        self.assertEqual(response.status_code, 200, response.content)
+        etags.append(self.get(self.url, if_none_match=etags[-1])["ETag"])
+        response = self.client.patch(
+            self.url,
+            [{"op": "add", "path": "/errors/-", "value": {"text": "x", "type": None}}],
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        etags.append(self.get(self.url, if_none_match=etags[-1])["ETag"])
+        self.assertEqual(len(set(etags)), 3)
+
+    def test_types_not_modified(self):
+        response = self.get("/api/types")
+        self.get("/api/types", 304, if_none_match=response["ETag"])
+        self.get("/api/types", 304, if_modified_since=response["Last-Modified"])
+
+    def test_etag_after_types_change(self):
+        quest_etag = self.get(self.url)["ETag"]
+        types_etag = self.get("/api/types")["ETag"]
+        with self.changed_types():
+            response = self.get("/api/types", if_none_match=types_etag)
+            self.assertIn("extra", response.json()["tasks"])
+            response = self.get(self.url, if_none_match=quest_etag)
+            self.assertIn("extra", response.json()["types"]["tasks"])
+
+
+class OriginRotationTest(DiaryTestCase):
+    """
+    Выбор источника для нового квеста (Origin.next_for_quest).
+    """
+
+    def pick(self, times: int) -> List[str]:
+        picked = []
+        for _ in range(times):
+            origin = Origin.next_for_quest()
+            origin.mark_extracted()
+            origin.save()
+            picked.append(origin.name)
+        return picked
+
+    def test_priority(self):
+        frozen = Origin.objects.create(name="frozen", status="f")
+        fresh = Origin.objects.create(name="fresh")
+        for name, hours in (("old", 2), ("recent", 1)):
+            Origin.objects.create(
+                name=name, last_extracted_at=now() - timedelta(hours=hours)
+            )
+        # актуальные раньше замороженных, ни разу не извлечённые — первыми по дате создания
+        self.assertEqual(
+            self.pick(5), ["origin", fresh.name, "old", "recent", "origin"]
+        )
+        Origin.objects.exclude(pk=frozen.pk).update(status="f")
+        self.assertEqual(self.pick(1), [frozen.name])
+
+    @override_settings(ORIGIN_ROTATION="weighted")
+    def test_weighted(self):
+        Origin.objects.create(name="heavy", weight=2)
+        Origin.objects.create(name="frozen", status="f", weight=5)
+        picked = self.pick(300)
+        self.assertNotIn("frozen", picked)
+        self.assertAlmostEqual(
+            picked.count("heavy") / picked.count("origin"), 2, delta=0.1
+        )
+
+
+class QuestsBatchTest(DiaryTestCase):
+    """
+    Пакетное создание квестов: ошибки по элементам, побочные эффекты — только от созданных.
+    """
+
+    def post(self, items: list, status_code: int) -> list:
+        response = self.client.post(
+            "/api/quests/batch", items, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status_code, response.content)
+        return response.json()["results"]
+
+    def quest(self, origin: int, *types: str) -> dict:
+        return {
+            "origin": origin,
+            "tasks": [{"text": "task", "type": type_} for type_ in types],
+        }
+
+    def test_partial(self):
+        other = Origin.objects.create(name="other")
+        results = self.post(
+            [
+                self.quest(self.origin.pk, "general", "puzzle"),
+                self.quest(0, "general"),
+                "not a quest",
+                self.quest(other.pk, "unknown"),
+                self.quest(self.origin.pk, "general"),
+            ],
+            207,
+        )
+        self.assertEqual(
+            [sorted(result) for result in results],
+            [["id"], ["errors"], ["errors"], ["errors"], ["id"]],
+        )
+        self.assertIn("origin", results[1]["errors"])
+        self.assertIn("non_field_errors", results[2]["errors"])
+        self.assertIn("tasks", results[3]["errors"])
+
+        quests = Quest.objects.order_by("pk")
+        self.assertEqual(
+            [quest.pk for quest in quests], [results[0]["id"], results[4]["id"]]
+        )
+        self.assertEqual([quest.tasks_total for quest in quests], [2, 1])
+        stats = DayStats.objects.get()
+        self.assertEqual((stats.quests_created, stats.tasks_total), (2, 3))
+        self.assertEqual(stats.task_types, {"general": {"0": 2}, "puzzle": {"0": 1}})
+        self.origin.refresh_from_db()
+        other.refresh_from_db()
+        self.assertIsNotNone(self.origin.last_extracted_at)
+        self.assertIsNone(other.last_extracted_at)
+
+    def test_all_invalid(self):
+        results = self.post([self.quest(0, "general"), []], 400)
+        self.assertTrue(all("errors" in result for result in results))
+        self.assertFalse(Quest.objects.exists())
+        self.assertFalse(DayStats.objects.exists())
+
+
+class CalendarTest(DiaryTestCase):
+    """
+    Календарь активности и переходы по дням в списке квестов: квесты есть только
+    10 и 5 дней назад и сегодня.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.today = localdate()
+        self.days = [self.today - timedelta(days=days) for days in (10, 5, 0)]
+        general = item_types.id("tasks", "general")
+        for date, statuses in zip(self.days, ([1, 0], [0], [1])):
+            for status in statuses:
+                # created_at задаётся явно, как при импорте и генерации истории
+                quest = Quest.objects.create(
+                    origin=self.origin,
+                    created_date=date,
+                    created_at=now() - (self.today - date),
+                    completed_at=now() if status else None,
+                    tasks_total=1,
+                    tasks_done=status,
+                )
+                Task.objects.create(quest=quest, type_id=general, status=status)
+        Day.objects.create(created_date=self.days[1], created_at=now(), content="note")
+
+    def test_calendar(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                "/api/calendar",
+                {"from": self.days[0].isoformat(), "to": self.today.isoformat()},
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        days = {day.pop("date"): day for day in response.json()}
+        self.assertEqual(len(days), 11)
+        self.assertEqual(
+            days[self.days[0].isoformat()],
+            {"quests": 2, "completed": 1, "tasks_ratio": 0.5, "note": False},
+        )
+        self.assertEqual(
+            days[self.days[1].isoformat()],
+            {"quests": 1, "completed": 0, "tasks_ratio": 0.0, "note": True},
+        )
+        self.assertEqual(
+            days[(self.today - timedelta(days=1)).isoformat()],
+            {"quests": 0, "completed": 0, "tasks_ratio": None, "note": False},
+        )
+
+    def navigate(self, date, *args) -> dict:
+        response = self.client.get(
+            "/quest/", {"date": date.isoformat(), **dict.fromkeys(args, "")}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_nearest_active_days(self):
+        context = self.navigate(self.today - timedelta(days=7))
+        self.assertEqual(
+            (context["previous_active"], context["next_active"]),
+            (self.days[0], self.days[1]),
+        )
+        self.assertEqual(len(context["object_list"]), 0)
+
+        context = self.navigate(self.days[1], "next")
+        self.assertEqual(context["date"], self.days[1] + timedelta(days=1))
+        self.assertEqual(context["next_active"], self.today)
+
+        context = self.navigate(self.days[0], "previous")
+        self.assertIsNone(context["previous_active"])
+        self.assertFalse(context["has_previous"])
+
+    def test_first_last(self):
+        context = self.navigate(self.days[1], "first")
+        self.assertEqual(context["date"], self.days[0])
+        self.assertEqual([quest.tasks_done for quest in context["object_list"]], [1, 0])
+        context = self.navigate(self.days[1], "last")
+        self.assertEqual(context["date"], self.today)
+        self.assertFalse(context["has_next"])
+
+    def test_created_at(self):
+        quest = Quest.objects.filter(created_date=self.days[0]).first()
+        self.assertLess(quest.created_at, now() - timedelta(days=9))
+        before = now()
+        quest = Quest.objects.create(origin=self.origin)
+        self.assertGreaterEqual(quest.created_at, before)
+        self.assertEqual(quest.created_date, localdate())
+
+
+class OriginTotalsTest(DiaryTestCase):
+    """
+    origin_totals (UNION ALL двух агрегатов) совпадает с подсчётом по строкам задач и элементов,
+    в том числе когда у части квестов источник удалён (origin = NULL).
+    """
+
+    def setUp(self):
+        super().setUp()
+        origins = [self.origin, *(Origin.objects.create(name=name) for name in "ab")]
+        for number, origin in enumerate(origins * 2):
+            self.origin = origin
+            quest = self.create_quest(
+                ("general", "puzzle")[: 2 - number % 2],
+                errors=[("e", "logic"), ("e", "memory"), ("e", None)][: number + 1],
+                problems=[("p", "skill")] * (number % 3),
+                knowledge=[("k", "concept")] * (number % 2),
+            )
+            if number % 2:
+                task = quest.tasks.first()
+                self.client.patch(
+                    f"/api/quest/{quest.pk}",
+                    [{"op": "replace", "path": f"/tasks/{task.pk}/status", "value": 1}],
+                    content_type="application/json",
+                )
+        self.origins = origins
+        self.deleted = origins[2].pk
+        origins[2].delete()
+
+    @staticmethod
+    def counted(origin_id) -> dict:
+        quests = Quest.objects.filter(origin=origin_id)
+        tasks = Task.objects.filter(quest__in=quests)
+        items = QuestItem.objects.filter(quest__in=quests)
+        errors = items.filter(kind=QuestItem.KINDS["errors"])
+        return {
+            "quests": quests.count(),
+            "completed": quests.exclude(completed_at=None).count(),
+            "tasks_total": tasks.count(),
+            "tasks_done": tasks.filter(status__gt=0).count(),
+            **{
+                key: items.filter(kind=kind).count()
+                for key, kind in QuestItem.KINDS.items()
+            },
+            "error_types": Counter(
+                item_types.name(type_id)
+                for type_id in errors.values_list("type", flat=True)
+            ),
+        }
+
+    def totals(self, origin_id) -> dict:
+        totals = origin_totals(origin_id)
+        totals["error_types"] = {
+            item["type"]: item["count"] for item in totals["error_types"]
+        }
+        return totals
+
+    def test_matches_counts(self):
+        self.assertEqual(Quest.objects.filter(origin=None).count(), 2)
+        for origin in self.origins[:2]:
+            with self.subTest(origin=origin.name):
+                self.assertEqual(self.totals(origin.pk), self.counted(origin.pk))
+        totals = self.totals(self.origins[0].pk)
+        self.assertEqual((totals["quests"], totals["completed"]), (2, 1))
+        # квесты удалённого источника не попадают ни в чьи итоги
+        self.assertEqual(
+            self.totals(self.deleted),
+            {**dict.fromkeys(ORIGIN_TOTALS, 0), "error_types": {}},
+        )
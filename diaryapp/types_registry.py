@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+from hashlib import sha256
+from json import loads, dumps
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+
+logger = getLogger("stdout")
+
+
+class TypesSnapshot:
+    """
+    Неизменяемый снимок types.json со всем, что нужно на пути запроса:
+    словарь подписей, frozenset-индексы ключей по разделам, хэш содержимого (для ETag),
+    время изменения файла и готовый JSON для отдачи клиенту.
+    """
+
+    __slots__ = "data", "index", "hash", "last_modified", "json"
+
+    def __init__(self, content: bytes, mtime: float):
+        self.data = loads(content)
+        self.index = {kind: frozenset(types) for kind, types in self.data.items()}
+        self.hash = sha256(content).hexdigest()
+        self.last_modified = datetime.fromtimestamp(mtime, tz=timezone.utc)
+        self.json = dumps(self.data, ensure_ascii=False).encode()
+
+    def __getitem__(self, kind: str) -> dict:
+        return self.data[kind]
+
+    def contains(self, kind: str, value: str) -> bool:
+        return value in self.index.get(kind, ())
+
+
+class TypesRegistry:
+    """
+    Реестр типов с перезагрузкой без перезапуска процесса: не чаще раза в check_interval секунд
+    сверяет mtime и размер файла и при изменении подменяет снимок целиком.
+    Невалидный файл не подменяет рабочий снимок.
+    """
+
+    def __init__(self, path: Path, check_interval: float = 1.0):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._lock = Lock()
+        self._signature = None
+        self._checked_at = 0.0
+        self._snapshot = None
+        self._reload()
+
+    def snapshot(self) -> TypesSnapshot:
+        if monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if monotonic() - self._checked_at >= self.check_interval:
+                    self._reload()
+        return self._snapshot
+
+    def __getitem__(self, kind: str) -> dict:
+        return self.snapshot()[kind]
+
+    def _reload(self):
+        self._checked_at = monotonic()
+        try:
+            stat = self.path.stat()
+            signature = stat.st_mtime_ns, stat.st_size
+            if signature == self._signature:
+                return
+            snapshot = TypesSnapshot(self.path.read_bytes(), stat.st_mtime)
+        except (OSError, ValueError) as exc:
+            if self._snapshot is None:
+                raise
+            logger.error(f"types registry: keeping previous {self.path}: {exc}")
+            return
+        self._snapshot = snapshot
+        self._signature = signature
+        logger.debug(f"types registry: loaded {self.path} ({snapshot.hash[:16]})")
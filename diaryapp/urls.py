@@ -3,6 +3,7 @@ from django.urls import path
 from .views import (
     OriginListView,
     OriginUpdateView,
+    OriginHistoryView,
     IndexTemplateView,
     OriginCreateView,
     QuestListView,
@@ -11,6 +12,18 @@ from .views import (
     QuestDeleteView,
     DayUpdateView,
     get_types,
+    get_cache_stats,
+    get_write_stats,
+    get_export,
+    get_export_csv,
+    get_error_report,
+    get_latency_report,
+    get_day_stats,
+    get_calendar,
+    get_quests,
+    get_origin_history,
+    post_quests_batch,
+    get_search,
     QuestApi,
     QuestCreateTemplateView,
 )
@@ -25,6 +38,11 @@ urlpatterns = [
         "origin/<int:pk>/update", view=OriginUpdateView.as_view(), name="origin_update"
     ),
     path("origin/create", view=OriginCreateView.as_view(), name="origin_form"),
+    path(
+        "origin/<int:pk>/history",
+        view=OriginHistoryView.as_view(),
+        name="origin_history",
+    ),
     path(
         "origin/<int:pk>/delete", view=OriginDeleteView.as_view(), name="origin_delete"
     ),
@@ -37,6 +55,20 @@ urlpatterns = [
     ),
     path("quest/<int:pk>/delete", view=QuestDeleteView.as_view(), name="quest_delete"),
     path("day/<int:pk>/update", view=DayUpdateView.as_view(), name="day_update_form"),
+    path("api/quest/<int:pk>", view=QuestApi.as_view()),
     path("api/quest/<int:pk>/update", view=QuestApi.as_view()),
     path("api/quest/create", view=QuestApi.as_view()),
+    path("api/quests", view=get_quests),
+    path("api/origins/<int:pk>/history", view=get_origin_history),
+    path("api/quests/batch", view=post_quests_batch),
+    path("api/search", view=get_search),
+    path("api/types", view=get_types),
+    path("api/cache/stats", view=get_cache_stats),
+    path("api/writes/stats", view=get_write_stats),
+    path("api/export", view=get_export),
+    path("api/export/csv", view=get_export_csv),
+    path("api/analytics/errors", view=get_error_report),
+    path("api/analytics/latency", view=get_latency_report),
+    path("api/stats", view=get_day_stats),
+    path("api/calendar", view=get_calendar),
 ]
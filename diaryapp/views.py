@@ -1,30 +1,70 @@
 from datetime import timedelta, datetime
+from hashlib import sha256
 from logging import getLogger
 
 from django.conf import settings
-from django.http import HttpRequest, Http404, JsonResponse
-from django.shortcuts import redirect
+from django.core.exceptions import BadRequest
+from django.db.models import Count, Q, Prefetch
+from django.db.transaction import atomic
+from django.http import HttpRequest, Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect, get_object_or_404
 from django.urls import reverse_lazy, reverse
-from django.utils.http import urlencode
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import urlencode, http_date
+from django.views.decorators.http import condition
 from django.views.generic import (
+    DetailView,
     ListView,
     CreateView,
     TemplateView,
     UpdateView,
     DeleteView,
 )
-from django.utils.timezone import now
+from django.utils.timezone import now, localdate
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
 
-from .models import Quest, Origin, Day, TYPES
-from .serializers import QuestEditModelSerializer, QuestCreateModelSerializer
+from .analytics import (
+    bump_data_version,
+    csv_lines,
+    cached_report,
+    error_report,
+    latency_report,
+)
+from .backup import export_lines
+from .cache import quest_cache, quest_updated_at, quest_version
+from .models import (
+    Quest,
+    Origin,
+    Day,
+    DayStats,
+    Task,
+    TYPES,
+)
+from .serializers import (
+    QuestEditModelSerializer,
+    QuestCreateModelSerializer,
+    QuestPatchOperationSerializer,
+    DayStatsModelSerializer,
+    QuestHistoryModelSerializer,
+    QuestShape,
+    OriginModelSerializer,
+)
+from .pagination import KeysetPagination
+from .retry import write_retry
+from .search import search
+from .types_registry import TypesSnapshot
+from .statistics import DayStatsDelta, origin_totals
 
 logger = getLogger("stdout")
 
+CALENDAR_MAX_DAYS = 366 * 10
+QUESTS_BATCH_MAX = 10_000
+
 
 class QuestApi(APIView):
     def get_object(self, pk):
@@ -42,23 +82,362 @@ class QuestApi(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request: Request, pk: int):
-        serializer = QuestEditModelSerializer(self.get_object(pk))
-        response = Response(data=serializer.data)
+        shape = QuestShape.from_query_params(request.query_params)
+        quest = self.get_object(pk)
+        types = TYPES.snapshot()
+        version = quest_version(quest, types)
+        if not shape.is_full:
+            version += f"-{sha256(shape.key().encode()).hexdigest()[:12]}"
+        etag = quote_etag(f"{quest.pk}-{version}")
+        last_modified = int(quest_updated_at(quest, types).timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            if shape.is_full:
+                data = quest_cache.get(quest, serialize_quest, types)
+            else:
+                data = quest_cache.lookup(quest, types)
+                if data is not None:
+                    data = shape.slice(data)
+                else:
+                    data = serialize_quest(quest, types, shape)
+            response = Response(data=data)
+        response.headers["ETag"] = etag
+        response.headers["Last-Modified"] = http_date(last_modified)
         return response
 
     def put(self, request: Request, pk: int):
         logger.debug(f"PUT(REST) request data {request.data}")
-        serializer = QuestEditModelSerializer(self.get_object(pk), data=request.data)
+        shape = QuestShape.from_query_params(request.query_params)
+        quest = self.get_object(pk)
+        serializer = QuestEditModelSerializer(
+            quest, data=request.data, context={"shape": shape.without_fields()}
+        )
         if serializer.is_valid():
             serializer.save()
-            return Response(serializer.data)
+            return Response(serialize_quest(quest, TYPES.snapshot(), shape))
         logger.debug(f"PUT(REST) validator errors {serializer.errors}")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def patch(self, request: Request, pk: int):
+        logger.debug(f"PATCH(REST) request data {request.data}")
+        shape = QuestShape.from_query_params(request.query_params)
+        quest = self.get_object(pk)
+        serializer = QuestPatchOperationSerializer(quest, data=request.data, many=True)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serialize_quest(quest, TYPES.snapshot(), shape))
+        logger.debug(f"PATCH(REST) validator errors {serializer.errors}")
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+def serialize_quest(quest: Quest, types: TypesSnapshot, shape=None) -> dict:
+    return QuestEditModelSerializer(
+        quest, context={"types": types, "shape": shape}
+    ).data
+
+
+def parse_date_range(
+    request: Request, default_days: int = 365, max_days: int | None = None
+):
+    """
+    Разбирает параметры from/to (ISO-даты, включительно). По умолчанию — последние default_days дней.
+
+    raise:
+    ValidationError: при неверном формате, from > to или периоде длиннее max_days.
+    """
+    try:
+        date_to = request.query_params.get("to")
+        date_to = datetime.fromisoformat(date_to).date() if date_to else localdate()
+        date_from = request.query_params.get("from")
+        date_from = (
+            datetime.fromisoformat(date_from).date()
+            if date_from
+            else date_to - timedelta(days=default_days - 1)
+        )
+    except ValueError:
+        raise ValidationError({"detail": "Dates must be in YYYY-MM-DD format"})
+    if date_from > date_to:
+        raise ValidationError({"detail": "from must not be later than to"})
+    if max_days is not None and (date_to - date_from).days >= max_days:
+        raise ValidationError({"detail": f"Range must not exceed {max_days} days"})
+    return date_from, date_to
+
+
+def parse_origin(request: Request) -> int | None:
+    origin = request.query_params.get("origin")
+    try:
+        return int(origin) if origin else None
+    except ValueError:
+        raise ValidationError({"origin": "Must be an integer"})
+
+
+@api_view(["GET"])
+def get_calendar(request: Request):
+    """
+    Активность по дням периода: количество квестов, завершённых квестов, доля выполненных задач
+    и наличие заметки дня. Один GROUP BY по Quest.created_date и один запрос по Day.
+    """
+    date_from, date_to = parse_date_range(request, max_days=CALENDAR_MAX_DAYS)
+    activity = {
+        row["created_date"]: row
+        for row in Quest.objects.filter(created_date__range=(date_from, date_to))
+        .values("created_date")
+        .annotate(
+            quests=Count("id", distinct=True),
+            completed=Count("id", distinct=True, filter=Q(completed_at__isnull=False)),
+            tasks_total=Count("tasks"),
+            tasks_done=Count("tasks", filter=Q(tasks__status__gt=0)),
+        )
+        .order_by()
+    }
+    notes = set(
+        Day.objects.filter(created_date__range=(date_from, date_to))
+        .exclude(content=None)
+        .exclude(content="")
+        .values_list("created_date", flat=True)
+    )
+
+    days = []
+    date = date_from
+    while date <= date_to:
+        row = activity.get(date)
+        days.append(
+            {
+                "date": date,
+                "quests": row["quests"] if row else 0,
+                "completed": row["completed"] if row else 0,
+                "tasks_ratio": (
+                    row["tasks_done"] / row["tasks_total"]
+                    if row and row["tasks_total"]
+                    else None
+                ),
+                "note": date in notes,
+            }
+        )
+        date += timedelta(days=1)
+    return Response(data=days)
+
+
+def quest_history_queryset():
+    return Quest.objects.prefetch_related(
+        Prefetch("tasks", queryset=Task.objects.order_by("pk")), "items"
+    )
+
+
+@api_view(["GET"])
+def get_quests(request: Request):
+    """
+    История квестов от новых к старым с keyset-пагинацией.
+    Фильтры: origin (id), status (completed/active), from/to (даты создания).
+    Запросов на страницу всегда три: квесты, задачи и элементы (ошибки, проблемы, знания) одной таблицей.
+    """
+    queryset = quest_history_queryset()
+    origin = parse_origin(request)
+    if origin is not None:
+        queryset = queryset.filter(origin=origin)
+    quest_status = request.query_params.get("status")
+    if quest_status == "completed":
+        queryset = queryset.filter(completed_at__isnull=False)
+    elif quest_status == "active":
+        queryset = queryset.filter(completed_at__isnull=True)
+    elif quest_status:
+        raise ValidationError({"status": "Must be completed or active"})
+    if "from" in request.query_params or "to" in request.query_params:
+        date_from, date_to = parse_date_range(request)
+        queryset = queryset.filter(created_date__range=(date_from, date_to))
+
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(
+        QuestHistoryModelSerializer(page, many=True).data
+    )
+
+
+def _origin_ids(items: list) -> set:
+    ids = set()
+    for item in items:
+        try:
+            ids.add(int(item["origin"]))
+        except (TypeError, KeyError, ValueError):
+            pass
+    return ids
+
+
+@api_view(["POST"])
+def post_quests_batch(request: Request):
+    """
+    Создаёт массив квестов (тело запроса — список в формате api/quest/create).
+
+    Каждый квест проверяется отдельно, источники для проверки загружаются одним запросом.
+    Все прошедшие проверку квесты создаются одной транзакцией (QuestCreateModelSerializer.create_batch).
+    results — по элементу на квест в порядке запроса: {"id": ...} или {"errors": {...}}.
+    Код ответа: 201 — созданы все, 207 — часть, 400 — ни одного.
+    """
+    items = request.data
+    if not isinstance(items, list) or not items:
+        raise ValidationError(
+            {"non_field_errors": "Expected a non-empty list of quests"}
+        )
+    if len(items) > QUESTS_BATCH_MAX:
+        raise ValidationError(
+            {"non_field_errors": f"No more than {QUESTS_BATCH_MAX} quests per batch"}
+        )
+
+    # один экземпляр сериализатора на весь пакет: поля строятся один раз, а не на каждый квест
+    serializer = QuestCreateModelSerializer(
+        context={"origins": Origin.objects.in_bulk(_origin_ids(items))}
+    )
+    valid, errors = [], []
+    for item in items:
+        try:
+            valid.append(serializer.run_validation(item))
+            errors.append(None)
+        except ValidationError as exc:
+            errors.append(exc.detail)
+    created = iter(QuestCreateModelSerializer.create_batch(valid))
+    results = [
+        {"id": next(created).pk} if error is None else {"errors": error}
+        for error in errors
+    ]
+    if len(valid) == len(items):
+        response_status = status.HTTP_201_CREATED
+    elif valid:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+    logger.debug(f"POST(REST) batch: {len(valid)} of {len(items)} quests created")
+    return Response({"results": results}, status=response_status)
+
+
+@api_view(["GET"])
+def get_origin_history(request: Request, pk: int):
+    """
+    История источника: его квесты от новых к старым с keyset-пагинацией по индексу (origin, created_at).
+    На первой странице (без cursor) — ещё итоги источника (statistics.origin_totals), одним запросом.
+    """
+    origin = get_object_or_404(Origin, pk=pk)
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(
+        quest_history_queryset().filter(origin=origin), request
+    )
+    response = paginator.get_paginated_response(
+        QuestHistoryModelSerializer(page, many=True).data
+    )
+    response.data = {
+        "origin": OriginModelSerializer(origin).data,
+        "totals": (
+            None
+            if request.query_params.get(paginator.cursor_query_param)
+            else origin_totals(origin.pk)
+        ),
+        **response.data,
+    }
+    return response
+
+
+@api_view(["GET"])
+def get_search(request: Request):
+    query = request.query_params.get("q", "")
+    try:
+        limit = min(max(int(request.query_params.get("limit", 20)), 1), 100)
+    except ValueError:
+        raise ValidationError({"limit": "Must be an integer"})
+    results = search(query, limit)
+    for result in results:
+        if result["quest"] is not None:
+            result["url"] = reverse(
+                "diaryapp:quest_update_form", args=(result["quest"],)
+            )
+        else:
+            result["url"] = (
+                f"{reverse('diaryapp:quest_list')}?{urlencode({'date': result['date']})}"
+            )
+    return Response(data=results)
+
+
+@api_view(["GET"])
+def get_day_stats(request: Request):
+    date_from, date_to = parse_date_range(request)
+    queryset = DayStats.objects.filter(date__range=(date_from, date_to)).order_by(
+        "date"
+    )
+    return Response(data=DayStatsModelSerializer(queryset, many=True).data)
+
+
+@api_view(["GET"])
+def get_error_report(request: Request):
+    """
+    Аналитика типов ошибок (diaryapp.analytics.error_report): частоты, совместная встречаемость,
+    доля квестов с ошибками по типам задач и тренд по неделям.
+    Фильтры: from/to (даты создания квестов), origin (id). Кэшируется до изменения данных.
+    """
+    date_from, date_to = parse_date_range(request)
+    return Response(
+        data=cached_report(error_report, date_from, date_to, parse_origin(request))
+    )
+
+
+@api_view(["GET"])
+def get_latency_report(request: Request):
+    """
+    Время до завершения квестов (p50/p90/p99), доля незавершённых и завершения по неделям —
+    всего, по источникам и по типам задач (diaryapp.analytics.latency_report).
+    Фильтр: from/to (даты создания квестов). Кэшируется до следующей записи квеста или источника.
+    """
+    date_from, date_to = parse_date_range(request)
+    return Response(data=cached_report(latency_report, date_from, date_to))
+
+
+@api_view(["GET"])
+def get_cache_stats(request: Request):
+    return Response(data=quest_cache.stats())
+
+
+@api_view(["GET"])
+def get_write_stats(request: Request):
+    return Response(data=write_retry.stats())
+
+
+@api_view(["GET"])
+def get_export(request: Request):
+    """
+    Весь дневник в NDJSON (формат — diaryapp.backup), отдаётся потоком по мере чтения из базы.
+    Загружается обратно командой manage.py import_diary.
+    """
+    response = StreamingHttpResponse(
+        export_lines(), content_type="application/x-ndjson"
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="diary-{localdate().isoformat()}.ndjson"'
+    )
+    return response
+
+
+@api_view(["GET"])
+def get_export_csv(request: Request):
+    """
+    CSV для анализа продуктивности: строка на задачу и на ошибку (формат — diaryapp.analytics.csv_lines).
+    Фильтры: from/to (даты создания квестов), origin (id).
+    """
+    date_from, date_to = parse_date_range(request)
+    response = StreamingHttpResponse(
+        csv_lines(date_from, date_to, parse_origin(request)), content_type="text/csv"
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="diary-{date_from.isoformat()}-{date_to.isoformat()}.csv"'
+    )
+    return response
+
 
 @api_view(["GET"])
+@condition(
+    etag_func=lambda request: quote_etag(TYPES.snapshot().hash),
+    last_modified_func=lambda request: TYPES.snapshot().last_modified,
+)
 def get_types(request: Request):
-    return JsonResponse(data=TYPES)
+    return HttpResponse(TYPES.snapshot().json, content_type="application/json")
 
 
 class IndexTemplateView(TemplateView):
@@ -67,7 +446,7 @@ class IndexTemplateView(TemplateView):
 
 class OriginCreateView(CreateView):
     model = Origin
-    fields = "name", "origin", "status"
+    fields = "name", "origin", "status", "weight"
     success_url = reverse_lazy("diaryapp:origin_list")
 
     def get_initial(self):
@@ -80,25 +459,54 @@ class OriginListView(ListView):
     queryset = Origin.objects.all()
 
 
+class OriginHistoryView(DetailView):
+    """
+    Страница истории источника: итоги и квесты от новых к старым страницами по KeysetPagination.
+    """
+
+    model = Origin
+    template_name = "diaryapp/origin_history.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        paginator = KeysetPagination()
+        try:
+            context["quests"] = paginator.paginate_queryset(
+                Quest.objects.filter(origin=self.object), self.request
+            )
+        except ValidationError:
+            raise BadRequest("Invalid cursor")
+        context["next_page"] = paginator.get_next_link()
+        context["totals"] = origin_totals(self.object.pk)
+        return context
+
+
 class OriginUpdateView(UpdateView):
     model = Origin
-    fields = "name", "status", "origin"
+    fields = "name", "status", "origin", "weight"
     success_url = reverse_lazy("diaryapp:origin_list")
     template_name = "diaryapp/origin_update_form.html"
 
     @staticmethod
+    @write_retry
     def _process_start_quest(origin_name: str):
-        origin = Origin.objects.get(name=origin_name)
-        Quest.objects.create(origin=origin)
-        origin.last_extracted_at = now()
-        origin.save()
+        with atomic():
+            origin = Origin.objects.get(name=origin_name)
+            quest = Quest.objects.create(origin=origin)
+            origin.mark_extracted()
+            origin.save()
+            delta = DayStatsDelta()
+            delta.add_quest(quest.created_date)
+            delta.apply()
+            bump_data_version()
         return redirect(reverse("diaryapp:quest_list"))
 
     def form_valid(self, form):
         origin_name = self.request.POST.get("origin_to_quest")
         if origin_name:
             return self._process_start_quest(origin_name)
-
+        # имя источника есть в отчётах
+        bump_data_version()
         return super().form_valid(form)
 
     def form_invalid(self, form):
@@ -122,25 +530,13 @@ class QuestCreateTemplateView(TemplateView):
                 "date": self.request.GET.get("date"),
                 "origins": Origin.objects.all(),
                 "default_origin": default_origin,
-                "tasks_types": TYPES["tasks"],
+                "tasks_types": TYPES.snapshot()["tasks"],
         })
         return self.render_to_response(context)
 
     @staticmethod
     def _extract_actual_origin():
-        new_origin = (
-            Origin.objects.filter(status="a", last_extracted_at=None)
-            .order_by("created_at")
-            .first()
-        )
-        if new_origin:
-            actual_origin = new_origin
-        else:
-            actual_origin = Origin.objects.filter(status="a").first()
-            
-        if not actual_origin:
-            return Origin.objects.filter(status="f").first()
-        return actual_origin
+        return Origin.next_for_quest()
 
 
 class QuestListView(ListView):
@@ -150,42 +546,66 @@ class QuestListView(ListView):
     delta_day = timedelta(days=1)
 
     def get_queryset(self):
-        date = self.request.GET.get("date", now().date())
+        date = self.request.GET.get("date", localdate())
         if isinstance(date, str):
             date = datetime.fromisoformat(date).date()
         return (
-            Quest.objects.filter(created_at__date=date)
+            Quest.objects.filter(created_date=date)
             .select_related("origin")
             .order_by("created_at")
         )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        date = self.request.GET.get("date", now().date())
+        date = self.request.GET.get("date", localdate())
         if isinstance(date, str):
             date = datetime.fromisoformat(date).date()
         day, created = Day.objects.get_or_create(
-            created_at__date=date, defaults={"created_at": date}
+            created_date=date, defaults={"created_at": date}
         )
         context["day"] = day
         context["date"] = date
-        context["has_previous"] = Quest.objects.filter(
-            created_at__date__lt=date
-        ).exists()
-        context["has_next"] = date < datetime.now().date()
+        context["previous_active"] = self._nearest_day(True, created_date__lt=date)
+        context["next_active"] = self._nearest_day(False, created_date__gt=date)
+        context["has_previous"] = context["previous_active"] is not None
+        context["has_next"] = date < localdate()
         return context
 
+    @staticmethod
+    def _nearest_day(descending: bool, **lookup):
+        """
+        Ближайший день с квестами: ORDER BY created_date ... LIMIT 1 по индексу (created_date, created_at),
+        т.е. один спуск по B-дереву независимо от длины истории и пропусков.
+
+        param:
+        descending (bool): искать назад (MAX) или вперёд (MIN).
+        lookup: условие на created_date, например created_date__lt=<дата>; без условия — последний или первый день.
+
+        return:
+        date | None: дата или None, если таких дней нет.
+        """
+        return (
+            Quest.objects.filter(**lookup)
+            .order_by("-created_date" if descending else "created_date")
+            .values_list("created_date", flat=True)
+            .first()
+        )
+
     def get(self, request: HttpRequest, *args, **kwargs):
         date_str = request.GET.get("date")
         if date_str:
             date = datetime.fromisoformat(date_str).date()
         else:
-            date = now().date()
+            date = localdate()
 
         if "previous" in request.GET:
             date -= self.delta_day
         elif "next" in request.GET:
             date += self.delta_day
+        elif "first" in request.GET:
+            date = self._nearest_day(False) or date
+        elif "last" in request.GET:
+            date = self._nearest_day(True) or date
 
         request.GET = request.GET.copy()
         request.GET["date"] = date.isoformat()
@@ -201,9 +621,9 @@ class QuestEditTemplateView(TemplateView):
         try:
             context["quest"] = Quest.objects.get(pk=self.kwargs.get("pk", -1))
             context["endpoint"] = (
-                f"http://{settings.API_HOST}:{settings.API_PORT}/api/quest/{context["quest"].pk}/update"
+                f"http://{settings.API_HOST}:{settings.API_PORT}/api/quest/{context['quest'].pk}"
             )
-            context["quest_data"] = QuestEditModelSerializer(context["quest"]).data
+            context["quest_data"] = quest_cache.get(context["quest"], serialize_quest)
             return context
         except Quest.DoesNotExist:
             raise Http404
@@ -230,10 +650,29 @@ class OriginDeleteView(DeleteView):
     model = Origin
     success_url = reverse_lazy("diaryapp:origin_list")
 
+    def form_valid(self, form):
+        quest_cache.invalidate(
+            *Quest.objects.filter(origin=self.object).values_list("pk", flat=True)
+        )
+        bump_data_version()
+        return super().form_valid(form)
+
 
 class QuestDeleteView(DeleteView):
     model = Quest
 
+    def form_valid(self, form):
+        # delete() обнуляет pk объекта
+        pk = self.object.pk
+        with atomic():
+            delta = DayStatsDelta()
+            delta.remove_quest(self.object)
+            response = super().form_valid(form)
+            delta.apply()
+            quest_cache.invalidate(pk)
+            bump_data_version()
+        return response
+
     def get_success_url(self):
         date_value = self.request.POST.get("date")
 